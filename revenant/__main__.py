@@ -0,0 +1,140 @@
+"""Command line interface for the whole package.
+
+    python -m revenant maps scan|list|verify DIR [bmp|dat] [--json]
+    python -m revenant maps automaps|heatmaps|progress|region|timeline|split ...
+    python -m revenant images known [--json]
+    python -m revenant images verify FILE.dat [--json]
+    python -m revenant images extract|insert FILE.dat
+    python -m revenant images export|import ...
+
+Commands that only scan or verify files do not import PIL,
+other commands are passed to automaps.py and images.py.
+"""
+import json
+import sys
+
+from revenant import api, profiling
+
+USAGE = '''You need to specify group and command to run this module
+
+Possible examples:
+python -m revenant maps scan my_dir [bmp|dat]
+python -m revenant maps list my_dir [bmp|dat]
+python -m revenant maps verify my_dir [bmp|dat]
+python -m revenant maps automaps my_dir
+python -m revenant maps heatmaps my_dir
+python -m revenant maps progress src1_dir src2_dir
+python -m revenant images known
+python -m revenant images verify somefile.dat
+python -m revenant images extract somefile.dat
+python -m revenant images insert somefile.dat
+python -m revenant images export *
+python -m revenant images import RevAPI_resources.zip
+
+Add --json to scan, list, verify and known commands to get json output.
+Other commands accept the same options as automaps.py and images.py.'''
+
+
+def print_maps(maps):
+    """Print maps description as a table."""
+    for key, value in maps.items():
+        print('\tMap [%s]: [%3d] tiles, x %d..%d, y %d..%d, sizes %d..%d' %
+              (str(key).rjust(2), value['tiles'], value['min_x'],
+               value['max_x'], value['min_y'], value['max_y'],
+               value['min_size'], value['max_size']))
+
+
+def maps_command(command, rest, as_json):
+    """Run one of the light map commands, return result to print."""
+    directory, *extension = rest
+    extension = extension[0] if extension else 'bmp'
+
+    if command == 'scan':
+        result = api.scan(directory, extension)
+        if not as_json:
+            print('Found %d maps in "%s"' % (len(result), directory))
+            print_maps(result)
+
+    elif command == 'list':
+        result = api.list_maps(directory, extension)
+        if not as_json:
+            for folder in result:
+                print(folder['folder'])
+                print_maps(folder['maps'])
+            if not result:
+                print('Nothing found')
+
+    else:
+        result = api.verify_tiles(directory, extension)
+        if not as_json:
+            print('Checked %d files in "%s", found %d problems' %
+                  (result['checked'], directory, len(result['problems'])))
+            for problem in result['problems']:
+                print('\t%s: %s' % (problem['file'], problem['problem']))
+
+    return result
+
+
+def images_command(command, rest, as_json):
+    """Run one of the light image commands, return result to print."""
+    if command == 'known':
+        result = api.list_known()
+        if not as_json:
+            for entry in result:
+                print('%-20s %8d %5d x %-5d %s' %
+                      (entry['file'], entry['start'], entry['width'],
+                       entry['height'], entry['postfix']))
+            if not result:
+                print('known.txt file is not found or empty')
+
+    else:
+        result = api.verify_dat(rest[0])
+        if not as_json:
+            print('%s: %s' % (result['file'],
+                              '; '.join(result['problems']) or 'ok'))
+
+    return result
+
+
+def main(args):
+    """Entry point, see module docstring for examples."""
+    as_json = '--json' in args
+    args = [arg for arg in args if arg != '--json']
+
+    if len(args) < 2:
+        print(USAGE)
+        sys.exit()
+
+    group, command, *rest = args
+    group = group.lower()
+    command = command.lower()
+
+    if group == 'maps' and command in ('scan', 'list', 'verify') and rest:
+        result = maps_command(command, rest, as_json)
+
+    elif group == 'images' and (command == 'known'
+                                or command == 'verify' and rest):
+        result = images_command(command, rest, as_json)
+
+    elif group == 'maps':
+        from revenant import automaps  # imports PIL
+        arguments, options = profiling.parse_args([command, *rest])
+        profiling.run(automaps.main, options, arguments)
+        return
+
+    elif group == 'images':
+        from revenant import images
+        arguments, options = profiling.parse_args([command, *rest])
+        profiling.run(images.main, options, arguments)
+        return
+
+    else:
+        print(f'Arguments are not recognised: {args}')
+        return
+
+    if as_json:
+        print(json.dumps(result, indent=2, default=str))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,230 @@
+"""Programmatic interface.
+
+Functions in this module return dictionaries and lists instead of printing,
+so they can be used from other tools. Scanning, listing and verification
+do not need PIL, it is imported only by functions that render images.
+
+Example:
+
+    from revenant import api
+
+    for folder in api.list_maps('game', 'dat'):
+        print(folder['folder'], list(folder['maps']))
+"""
+import os.path
+import struct
+
+try:
+    from revenant import tiles
+except ImportError:  # launched as a script from revenant directory
+    import tiles
+
+BMP_HEADER = struct.Struct('<2s16xii')  # magic, width, height
+TILE_SIZE = 64  # in pixels, same as automaps.AUTOMAP_TILE_SIZE
+
+
+def describe(data):
+    """
+    Converts result of scan_for_files func into readable form.
+
+    :param data: prepared dictionary from scan_for_files func
+    :return: dictionary {map: {tiles, min_x, max_x, min_y, max_y, ...}}
+    """
+    return {
+        key: {
+            'tiles': value[0],
+            'min_x': value[1],
+            'max_x': value[2],
+            'min_y': value[3],
+            'max_y': value[4],
+            'directory': value[5],
+            'min_size': value[6],
+            'max_size': value[7],
+        }
+        for key, value in (data or {}).items()
+    }
+
+
+def scan(directory, extension='bmp'):
+    """
+    Scans one directory (or archive) for name_x_y files.
+
+    :param directory: where to search files
+    :param extension: 'bmp' for automaps or 'dat' for maps
+    :return: dictionary {map: description}, empty if nothing found
+    """
+    return describe(tiles.scan_for_files(directory, extension, verbose=False))
+
+
+def list_maps(path, extension='bmp', workers=None):
+    """
+    Scans directory and all nested directories for name_x_y files.
+
+    :param path: where to start
+    :param extension: 'bmp' for automaps or 'dat' for maps
+    :param workers: number of threads for scanning
+    :return: list of {'folder': path, 'maps': {map: description}}
+    """
+    folders = tiles.discover_folders(path)
+    return [
+        {'folder': folder, 'maps': describe(data)}
+        for folder, data in tiles.scan_folders(folders, extension, workers,
+                                               verbose=False)
+    ]
+
+
+def verify_tiles(directory, extension='bmp'):
+    """
+    Checks that found tiles can be used by stitching functions.
+    Automap tiles must be 64x64 bmp images, map files must not be empty.
+    Only headers of bmp files are read.
+
+    :param directory: where to search files
+    :param extension: 'bmp' for automaps or 'dat' for maps
+    :return: dictionary with number of checked files and list of problems
+    """
+    data = tiles.scan_for_files(directory, extension, verbose=False)
+    checked = 0
+    problems = []
+
+    for key, value in (data or {}).items():
+        for (x, y), file_size in sorted(value[8].items()):
+            name = '%d_%d_%d.%s' % (key, x, y, extension)
+            checked += 1
+
+            if not file_size:
+                problems.append({'file': name, 'problem': 'empty file'})
+                continue
+
+            if extension.lower() != 'bmp':
+                continue
+
+            problem = _check_bmp(tiles.open_tile(data, key, name))
+            if problem:
+                problems.append({'file': name, 'problem': problem})
+
+    return {'directory': directory, 'checked': checked, 'problems': problems}
+
+
+def _check_bmp(source):
+    """Check header of the automap tile, return problem or None."""
+    if isinstance(source, str):
+        with open(source, 'rb') as file:
+            header = file.read(BMP_HEADER.size)
+    else:
+        header = source.read(BMP_HEADER.size)
+
+    if len(header) < BMP_HEADER.size:
+        return 'file is too small'
+
+    magic, width, height = BMP_HEADER.unpack(header)
+
+    if magic != b'BM':
+        return 'not a bmp file'
+
+    # negative height means top-down bmp
+    if (width, abs(height)) != (TILE_SIZE, TILE_SIZE):
+        return 'size is %d x %d, expected %d x %d' % (
+            width, abs(height), TILE_SIZE, TILE_SIZE)
+
+    return None
+
+
+def list_known(known_file=None):
+    """
+    Lists images described in known.txt.
+
+    :param known_file: path to known.txt, default one is used if not set
+    :return: list of {'file', 'start', 'width', 'height', 'postfix'}
+    """
+    images = _images()
+    known = images.get_known_files(known_file or images.KNOWN_FILE,
+                                   verbose=False)
+    return [
+        {'file': file, 'start': start, 'width': width, 'height': height,
+         'postfix': postfix}
+        for file, start, width, height, postfix in known or []
+    ]
+
+
+def verify_dat(filename, known_file=None):
+    """
+    Checks that dat file is big enough for all images known.txt expects in it.
+
+    :param filename: dat file, like 'menus.dat'
+    :param known_file: path to known.txt, default one is used if not set
+    :return: dictionary with size of the file and list of problems
+    """
+    name = os.path.basename(filename)
+    entries = [entry for entry in list_known(known_file)
+               if entry['file'].lower() == name.lower()]
+    problems = []
+
+    if not os.path.isfile(filename):
+        return {'file': filename, 'size': None,
+                'problems': ['file is not found']}
+
+    size = os.path.getsize(filename)
+
+    if not entries:
+        problems.append('file is not described in known.txt')
+
+    for entry in entries:
+        end = entry['start'] + entry['width'] * entry['height'] * 2
+        if end > size:
+            problems.append('image [%s] needs %d bytes, file has %d' %
+                            (entry['postfix'], end, size))
+
+    return {'file': filename, 'size': size, 'problems': problems}
+
+
+def render(kind, directory, map_id, region=None, progress=None):
+    """
+    Renders map (or part of it) into image without saving it.
+
+    :param kind: 'automaps', 'heatmaps' or 'progress'
+    :param directory: where tiles are ('bmp' for automaps, 'dat' otherwise)
+    :param map_id: map name
+    :param region: (x0, y0, x1, y1), whole map if not set
+    :param progress: directory with savegame files, only for progress
+    :return: PIL image or None if map is not found
+    """
+    automaps = _automaps()
+    extension = 'bmp' if kind == 'automaps' else 'dat'
+    # brightness of heatmaps depends on the biggest file of the map
+    box = region if kind == 'automaps' else None
+    data = tiles.scan_for_files(directory, extension, verbose=False,
+                                key=map_id, box=box)
+
+    if not data or map_id not in data:
+        return None
+
+    if region is None:
+        min_x, max_x, min_y, max_y = data[map_id][1:5]
+        region = (min_x, min_y, max_x, max_y)
+
+    progress_data = None
+    if progress is not None:
+        progress_data = tiles.scan_for_files(progress, extension,
+                                             verbose=False, key=map_id)
+
+    return automaps.render_region(data, map_id, *region, kind=kind,
+                                  progress_data=progress_data) or None
+
+
+def _automaps():
+    """Import automaps module (and PIL) on first use."""
+    try:
+        from revenant import automaps
+    except ImportError:  # launched as a script from revenant directory
+        import automaps
+    return automaps
+
+
+def _images():
+    """Import images module on first use."""
+    try:
+        from revenant import images
+    except ImportError:  # launched as a script from revenant directory
+        import images
+    return images
@@ -0,0 +1,271 @@
+"""Reading tiles directly from archives.
+
+Automap tiles and map files can be stored in zip or tar archive instead
+of thousands of loose name_x_y files. Names and sizes of the files are
+taken from the archive index (central directory for zip), so nothing is
+extracted. Every archive is opened only once and its handle is reused
+until the archive itself changes.
+
+Files inside of the archive are looked up by their base names,
+so 'automaps/1_2_3.bmp' inside of the archive is available as '1_2_3.bmp'.
+Folder inside of the archive can be selected as a part of the path,
+for example 'game.zip/map/'. Files with the same base name in different
+folders (like 'map/1_0_0.dat' and 'savegame/1_0_0.dat') can't be mixed,
+such folder has to be selected explicitly.
+
+Broken archives raise OSError, zipfile and tarfile are imported only
+when an archive is actually found.
+"""
+import io
+import os
+import threading
+
+_lock = threading.Lock()
+_archives = {}
+
+
+class DuplicateNamesError(ValueError):
+    """Files from different folders of the archive have the same name."""
+
+
+class Archive:
+    """Opened zip or tar archive with index of its files."""
+
+    def __init__(self, path):
+        import zipfile
+
+        self.path = path
+        self._lock = threading.Lock()
+
+        if zipfile.is_zipfile(path):
+            try:
+                self._zip = zipfile.ZipFile(path)
+            except zipfile.BadZipFile as error:
+                raise OSError('Broken archive %s: %s' % (path, error))
+            self._tar = None
+            members = [(info, info.filename, info.file_size)
+                       for info in self._zip.infolist() if not info.is_dir()]
+        else:
+            import tarfile
+
+            self._zip = None
+            try:
+                self._tar = tarfile.open(path)
+            except tarfile.TarError as error:
+                raise OSError('Broken archive %s: %s' % (path, error))
+            members = [(info, info.name, info.size)
+                       for info in self._tar.getmembers() if info.isfile()]
+
+        # full name -> (member, size)
+        self.members = {
+            name.replace('\\', '/').strip('/'): (member, size)
+            for member, name, size in members
+        }
+        self._listings = {}
+
+    def folders(self):
+        """Folders of the archive that contain files, '' for the root."""
+        return sorted({name.rpartition('/')[0] for name in self.members})
+
+    def listing(self, folder=''):
+        """
+        Files of the folder (and its sub folders) by their base names.
+
+        :param folder: folder inside of the archive, whole archive if empty
+        :return: dictionary {base name: (member, size)}
+        """
+        with self._lock:
+            cached = self._listings.get(folder)
+        if cached is not None:
+            return cached
+
+        prefix = folder + '/' if folder else ''
+        result = {}
+        duplicates = []
+
+        for name, value in self.members.items():
+            if not name.startswith(prefix):
+                continue
+            base = name.rsplit('/', 1)[-1]
+            if base in result:
+                duplicates.append(name)
+            result[base] = value
+
+        if duplicates:
+            raise DuplicateNamesError(
+                'Archive "%s" has %d files with the same names in different '
+                'folders (like "%s"), select folder like "%s/folder/"' %
+                (self.path, len(duplicates), duplicates[0],
+                 '/'.join(filter(None, (self.path, folder)))))
+
+        with self._lock:
+            self._listings[folder] = result
+        return result
+
+    def read(self, name, folder=''):
+        """Read contents of the file with given base name."""
+        member, _ = self.listing(folder)[name]
+
+        # both zip and tar read through one shared file handle
+        with self._lock:
+            if self._zip is not None:
+                return self._zip.read(member)
+            return self._tar.extractfile(member).read()
+
+
+def _is_archive(path):
+    """Check that existing file is zip or tar archive."""
+    import zipfile
+
+    if zipfile.is_zipfile(path):
+        return True
+
+    import tarfile
+    return tarfile.is_tarfile(path)
+
+
+def split_path(directory):
+    """
+    Splits path like 'game.zip/map/' into archive and folder inside of it.
+
+    :param directory: path, possibly with trailing slash
+    :return: tuple (archive, folder) or None if it's not an archive
+    """
+    path = directory.replace('\\', '/').rstrip('/')
+    folder = []
+
+    while path and not os.path.isdir(path):
+        if os.path.isfile(path):
+            if _is_archive(path):
+                return path, '/'.join(reversed(folder))
+            return None
+        path, _, part = path.rpartition('/')
+        folder.append(part)
+
+    return None
+
+
+def archive_path(directory):
+    """
+    Checks if given 'directory' is actually an archive (or folder in it).
+
+    :param directory: path, possibly with trailing slash
+    :return: path to the archive or None if it's not an archive
+    """
+    parts = split_path(directory)
+    return parts[0] if parts else None
+
+
+def _split_existing(directory):
+    """Same as split_path, but missing archive is an error."""
+    parts = split_path(directory)
+    if parts is None:
+        raise FileNotFoundError('Archive is not found: %s' % directory)
+    return parts
+
+
+def open_archive(path):
+    """
+    Returns opened archive, reopens it if archive was changed.
+
+    :param path: path to zip or tar file
+    :return: Archive instance
+    """
+    stat = os.stat(path)
+    version = (stat.st_mtime_ns, stat.st_size)
+
+    with _lock:
+        cached = _archives.get(path)
+
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        # outdated handle is closed when last reader releases it
+        archive = Archive(path)
+        _archives[path] = (version, archive)
+
+    return archive
+
+
+def list_files(directory):
+    """
+    Names and sizes of all files in the archive.
+
+    :param directory: path to zip or tar file, or to the folder inside of it
+    :return: dictionary {base name: size}
+    :raise DuplicateNamesError: if files of different folders have same names
+    """
+    path, folder = _split_existing(directory)
+    return {name: size
+            for name, (_, size) in open_archive(path).listing(folder).items()}
+
+
+def list_folders(directory):
+    """
+    Folders of the archive that contain files.
+
+    :param directory: path to zip or tar file
+    :return: list of paths like 'game.zip/map'
+    """
+    path, folder = _split_existing(directory)
+    directory = directory.rstrip('/\\')
+    prefix = folder + '/' if folder else ''
+
+    result = []
+    for name in open_archive(path).folders():
+        if name == folder:
+            result.append(directory)
+        elif name.startswith(prefix):
+            result.append(directory + '/' + name[len(prefix):])
+
+    return result
+
+
+class FolderSource:
+    """Regular directory, files are opened by path."""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def open(self, name):
+        """Path to the file with given base name."""
+        return self.directory + name
+
+
+class ArchiveSource:
+    """Folder of already opened archive."""
+
+    def __init__(self, archive, folder):
+        self.archive = archive
+        self.folder = folder
+
+    def open(self, name):
+        """File-like object with contents of the file with given base name."""
+        return io.BytesIO(self.archive.read(name, self.folder))
+
+
+def resolve(directory):
+    """
+    Checks once what given directory is, so its files can be opened
+    without any further checks or stat calls.
+
+    :param directory: directory or archive, ends with slash
+    :return: FolderSource or ArchiveSource
+    """
+    if os.path.isdir(directory):
+        return FolderSource(directory)
+
+    path, folder = _split_existing(directory)
+    return ArchiveSource(open_archive(path), folder)
+
+
+def open_file(directory, name):
+    """
+    Opens file from regular directory or from archive.
+    Use resolve func instead to open many files from the same directory.
+
+    :param directory: directory or archive, ends with slash
+    :param name: base name of the file
+    :return: path for regular files, file-like object for archives
+    """
+    return resolve(directory).open(name)
@@ -8,197 +8,328 @@ http://accursedfarms.com/forums/viewtopic.php?f=63&t=8128
 Some illustrating tweaks by Nicord
 https://www.moddb.com/mods/the-forsaken
 """
+import json
+import math
 import os.path
 import sys
-from typing import Callable
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Callable, Optional
 
 from PIL import Image
 
+try:
+    from revenant import archives, profiling
+    from revenant.tiles import (discover_folders, open_tile, output_name,
+                                scan_folders, scan_for_files, tiles_in_region)
+except ImportError:  # launched as a script from revenant directory
+    import archives
+    import profiling
+    from tiles import (discover_folders, open_tile, output_name,
+                       scan_folders, scan_for_files, tiles_in_region)
+
+AUTOMAP_TILE_SIZE = 64  # in pixels
+HEATMAP_TILE_SIZE = 16  # in pixels
+BACKGROUND = (32, 32, 32)
+VIOLET = (1, 0, 1)
+GREEN = (0, 1, 0)
+TIMELINE_FRAME_SIZE = 800  # in pixels, for contact sheets and animations
+
+# output format -> file extension
+OUTPUT_FORMATS = {
+    'bmp': '.bmp',
+    'bmp8': '.bmp',
+    'png': '.png',
+    'webp': '.webp',
+}
+
+# big images are compressed in parallel, zlib releases GIL while working
+ENCODER_WORKERS = os.cpu_count() or 1
+_encoder = ThreadPoolExecutor(max_workers=ENCODER_WORKERS,
+                              thread_name_prefix='encoder')
+
+
+def save_image(map_image, filename, output_format='bmp', compress_level=6):
+    """
+    Saves image on the encoder thread pool.
+
+    Formats:
+        'bmp'  - 24 bit uncompressed bmp
+        'bmp8' - 8 bit palette bmp
+        'png'  - png with given compression level
+        'webp' - lossless webp with given compression level
+
+    For 'bmp8' and 'png' images with no more than 256 colors (heatmaps)
+    are saved with palette. That conversion is lossless. Images with more
+    colors (automaps, progress) are saved by 'bmp8' with colors reduced
+    to 256, a message is printed about that.
+
+    :param map_image: image to save
+    :param filename: where to save it
+    :param output_format: one of OUTPUT_FORMATS
+    :param compress_level: compression level for png and webp (0-9)
+    :return: future, resolved when file is written
+    """
+    return _encoder.submit(_encode, map_image, filename,
+                           output_format, compress_level)
+
+
+def _encode(map_image, filename, output_format, compress_level):
+    with profiling.timer('encode'):
+        if output_format in ('bmp8', 'png'):
+            palette_image = palettize(map_image)
+
+            # 8 bit bmp can't keep more colors, png keeps them as is
+            if output_format == 'bmp8' and palette_image is map_image:
+                print('\t\t[%s] has more than 256 colors, '
+                      'they are reduced to save it as 8 bit bmp' % filename)
+                palette_image = map_image.quantize(colors=256, method=0,
+                                                   dither=0)
+
+            map_image = palette_image
+
+        if output_format == 'png':
+            map_image.save(filename, 'PNG', compress_level=compress_level)
+        elif output_format == 'webp':
+            map_image.save(filename, 'WEBP', lossless=True,
+                           method=min(compress_level, 6))
+        else:
+            map_image.save(filename, 'BMP')
+
+
+def palettize(map_image):
+    """
+    Converts image into 8 bit palette image without loss of colors.
 
-def scan_for_files(directory, extension):
+    :param map_image: RGB image
+    :return: palette image, or the same image if it has more than 256 colors
     """
-    Scans directory for sequence of files.
-    Considered pattern is [name]_[x]_[y].
-    Both maps ('dat' files) and automaps ('bmp' files) are supported,
-    but you need to mention file extension.
+    if map_image.getcolors(256) is None:
+        return map_image
 
-    Each parameter in filename must be a number (including negative),
-    Length of the parameter must be less than 4 letters.
+    # median cut (method 0) keeps every color when there are no more
+    # colors than palette entries
+    return map_image.quantize(colors=256, method=0, dither=0)
 
-    :param directory: where to search files, for example 'automaps/"
-    :param extension: specific type of file, only 'bmp' or 'dat' are supported
-    :return: dictionary with found sequences and their parameters. False if nothing found
+
+def wait_for(pending):
+    """Wait until all given saving jobs are done, raise their errors."""
+    for future in pending:
+        future.result()
+
+
+def wait_for_room(pending, limit=ENCODER_WORKERS):
     """
-    if directory[-1] != '/' and directory[-1] != '\\':
-        directory = directory + '/'
+    Wait for the oldest saving jobs, so no more than [limit] images
+    are kept in memory waiting to be written.
 
-    if os.path.isdir(directory):
-        files = os.listdir(directory)
+    :param pending: list of futures from save_image func, done ones are removed
+    :param limit: maximum number of jobs left in the list
+    """
+    while len(pending) >= limit:
+        pending.pop(0).result()
 
-    else:
-        print(f'No directory named "{directory}" has been found!')
-        return False
 
-    print(f'Scanning "{directory}" for files like "name_x_y.{extension}"')
+def free_file_name(base, extension='.bmp'):
+    """
+    Finds name for the new file, existing files are not overwritten.
+    For example 'map_01.bmp', 'map_01(1).bmp', 'map_01(2).bmp'.
 
-    names = []
-    raw_data = []
-    ignored = 0
+    :param base: path to the file without extension
+    :param extension: extension of the file, including dot
+    :return: path to the file that does not exist yet
+    """
+    new_file = base + extension
 
-    for file in files:
-        if file[-3:].lower() != extension.lower():
-            # wrong extension
-            ignored += 1
-            continue
+    # do not overwrite!
+    add = 1
+    while os.path.isfile(new_file):
+        new_file = base + '(' + str(add) + ')' + extension
+        add += 1
 
-        if os.path.isfile(directory + file):
-            name_x_y = file.split('_')
+    return new_file
 
-            file_is_correct = True
 
-            if len(name_x_y) != 3:
-                ignored += 1
-                continue
-            else:
-                # removing extension
-                name_x_y[2] = name_x_y[2][0:-4]
-
-            if len(name_x_y[0]) > 3:
-                file_is_correct = False
-
-            if len(name_x_y[1]) > 3:
-                file_is_correct = False
-
-            if len(name_x_y[2]) > 3:
-                file_is_correct = False
-
-            if not str(name_x_y[0]).isdigit():
-                file_is_correct = False
-
-            # checking for negative numbers
-            if name_x_y[1][0] == '-':
-                if not str(name_x_y[1][1:]).isdigit():
-                    file_is_correct = False
-            else:
-                if not str(name_x_y[1]).isdigit():
-                    file_is_correct = False
-
-            # checking for negative numbers
-            if name_x_y[2][0] == '-':
-                if not str(name_x_y[2][1:]).isdigit():
-                    file_is_correct = False
-            else:
-                if not str(name_x_y[2]).isdigit():
-                    file_is_correct = False
-
-            if file_is_correct:
-                names.append(int(name_x_y[0]))
-                # Files are named by pattern name_x_y.type
-                file_size = os.path.getsize(directory + file)
-                raw_data.append(
-                    [int(name_x_y[0]), int(name_x_y[1]), int(name_x_y[2]),
-                     file_size])
-            else:
-                ignored += 1
-                continue
+def heat_color(file_size, max_size):
+    """
+    Calculates brightness of the heatmap tile.
+    Bigger the file, brighter the tile it represents.
 
-    unique_names = list(set(names))
+    :param file_size: size of the dat file
+    :param max_size: size of the biggest dat file of the map
+    :return: brightness (16-255)
+    """
+    delta = 256 / max_size  # minimum size is usually too small to be used
+    color = int(file_size * delta)
+    return min(max(color, 16), 255)
 
-    if not unique_names:
-        print('...nothing found')
-        return False
 
-    data = {}
+def render_automap(data, key, x0, y0, x1, y1):
+    """
+    Renders automap image for given region of the map.
+
+    :param data: prepared dictionary from scan_for_files func ('bmp' files)
+    :param key: map name
+    :param x0: left border of the region (inclusive)
+    :param y0: top border of the region (inclusive)
+    :param x1: right border of the region (inclusive)
+    :param y1: bottom border of the region (inclusive)
+    :return: tuple (image, number of pasted tiles)
+    """
+    map_image = Image.new('RGB', (AUTOMAP_TILE_SIZE * (x1 - x0 + 1),
+                                  AUTOMAP_TILE_SIZE * (y1 - y0 + 1)))
+    pasted = 0
+
+    for curr_x, curr_y, file_size in tiles_in_region(data, key,
+                                                     x0, y0, x1, y1):
+        with profiling.timer('decode'):
+            tile_file = open_tile(data, key, "%d_%d_%d.bmp" %
+                                  (key, curr_x, curr_y))
+            tile_image = Image.open(tile_file)
+            tile_image.load()
+
+        with profiling.timer('paste'):
+            paste_x = AUTOMAP_TILE_SIZE * (curr_x - x0)
+            paste_y = AUTOMAP_TILE_SIZE * (curr_y - y0)
+            map_image.paste(tile_image, (paste_x, paste_y))
+
+        tile_image.close()
+
+        pasted += 1
+        profiling.count('files read')
+        profiling.count('bytes read', file_size)
+
+    profiling.count('tiles pasted', pasted)
+
+    return map_image, pasted
+
+
+@profiling.timed('paste')
+def paint_heatmap(map_image, data, key, x0, y0, x1, y1, shade=VIOLET):
+    """
+    Paints heatmap tiles for given region over existing image.
+
+    :param map_image: image to paint on, top left corner is (x0, y0) tile
+    :param data: prepared dictionary from scan_for_files func ('dat' files)
+    :param key: map name
+    :param x0: left border of the region (inclusive)
+    :param y0: top border of the region (inclusive)
+    :param x1: right border of the region (inclusive)
+    :param y1: bottom border of the region (inclusive)
+    :param shade: color mask, for example (1, 0, 1) for violet shades
+    :return: number of painted tiles
+    """
+    max_size = data[key][7]
+    painted = 0
+
+    for curr_x, curr_y, file_size in tiles_in_region(data, key,
+                                                     x0, y0, x1, y1):
+        color = heat_color(file_size, max_size)
+        paste_x = HEATMAP_TILE_SIZE * (curr_x - x0)
+        paste_y = HEATMAP_TILE_SIZE * (curr_y - y0)
+        map_image.paste(tuple(color * channel for channel in shade),
+                        (paste_x, paste_y,
+                         paste_x + HEATMAP_TILE_SIZE,
+                         paste_y + HEATMAP_TILE_SIZE))
+        painted += 1
+
+    profiling.count('tiles pasted', painted)
+    return painted
+
+
+def render_heatmap(data, key, x0, y0, x1, y1, shade=VIOLET):
+    """
+    Renders heatmap image for given region of the map.
+
+    :param data: prepared dictionary from scan_for_files func ('dat' files)
+    :param key: map name
+    :param x0: left border of the region (inclusive)
+    :param y0: top border of the region (inclusive)
+    :param x1: right border of the region (inclusive)
+    :param y1: bottom border of the region (inclusive)
+    :param shade: color mask, for example (1, 0, 1) for violet shades
+    :return: tuple (image, number of painted tiles)
+    """
+    map_image = Image.new('RGB', (HEATMAP_TILE_SIZE * (x1 - x0 + 1),
+                                  HEATMAP_TILE_SIZE * (y1 - y0 + 1)),
+                          BACKGROUND)
+    painted = paint_heatmap(map_image, data, key, x0, y0, x1, y1, shade)
+    return map_image, painted
+
 
-    for name in unique_names:
-        data[name] = []
-        data[name].append(names.count(name))
-        list_of_x = []
-        list_of_y = []
-        list_of_sizes = []
+def render_progress(source_data, progress_data, key, x0, y0, x1, y1):
+    """
+    Renders player's progress (green) over original heatmap (violet)
+    for given region of the map.
 
-        for raw in raw_data:
-            # name_x_y
-            if raw[0] == name:
-                list_of_x.append(raw[1])
-                list_of_y.append(raw[2])
-                list_of_sizes.append(raw[3])
+    :param source_data: prepared dictionary from scan_for_files func. This describes default world map
+    :param progress_data: prepared dictionary from scan_for_files func. This describes player progress
+    :param key: map name
+    :param x0: left border of the region (inclusive)
+    :param y0: top border of the region (inclusive)
+    :param x1: right border of the region (inclusive)
+    :param y1: bottom border of the region (inclusive)
+    :return: tuple (image, number of painted original and progress tiles)
+    """
+    painted = 0
+    if key in source_data:
+        map_image, painted = render_heatmap(source_data, key,
+                                            x0, y0, x1, y1)
+    else:
+        map_image = Image.new('RGB', (HEATMAP_TILE_SIZE * (x1 - x0 + 1),
+                                      HEATMAP_TILE_SIZE * (y1 - y0 + 1)),
+                              BACKGROUND)
 
-        # Data is formed using template
-        # [name]:[counts][minX][maxX][minY][maxY][directory][min_size][max_size]
-        data[name].append(min(list_of_x))
-        data[name].append(max(list_of_x))
-        data[name].append(min(list_of_y))
-        data[name].append(max(list_of_y))
-        data[name].append(directory)
-        data[name].append(min(list_of_sizes))
-        data[name].append(max(list_of_sizes))
+    # unvisited areas still show original map
+    if key in progress_data:
+        painted += paint_heatmap(map_image, progress_data, key,
+                                 x0, y0, x1, y1, GREEN)
 
-    print()
-    print('\t Found %d tiles for %d maps in "%s" (%d files ignored)' %
-          (len(raw_data), len(data.keys()), directory[:-1], ignored))
-    return data
+    return map_image, painted
 
 
-def stitch_automaps(data, dest_dir='RevAPI_automaps'):
+def stitch_automaps(data, dest_dir='RevAPI_automaps', output_format='bmp',
+                    compress_level=6):
     """
     Stitches big automap image from small tiles and saves it as bmp file.
 
     :param data: prepared dictionary from scan_for_files func
     :param dest_dir: where to save files
+    :param output_format: 'bmp', 'bmp8', 'png' or 'webp', see save_image func
+    :param compress_level: compression level for png and webp (0-9)
     :return: True if nothing interrupted the process. False if there are any errors.
     """
     if not data:
         return False
 
-    tile_size = 64  # in pixels
+    tile_size = AUTOMAP_TILE_SIZE
+    extension = OUTPUT_FORMATS[output_format]
     iteration = 1
+    pending = []
 
     for key in data.keys():
-        has_maps = False
-
         min_x = data[key][1]
         max_x = data[key][2]
         min_y = data[key][3]
         max_y = data[key][4]
         directory = data[key][5]
 
-        filename = directory[:-1]
+        filename = output_name(directory)
 
         map_width = abs(min_x - max_x) + 1
         map_height = abs(min_y - max_y) + 1
 
-        map_image = Image.new('RGB',
-                              (tile_size * map_width, tile_size * map_height))
-
-        for curr_y in range(min_y, max_y + 1):
-            for curr_x in range(min_x, max_x + 1):
-                tile_file = directory + "%d_%d_%d.bmp" % (key, curr_x, curr_y)
-
-                if os.path.isfile(tile_file):
-                    # not all files in allowed range actually exist
-                    has_maps = True
-                    tile_image = Image.open(tile_file)
-                    paste_x = tile_size * (curr_x - min_x)
-                    paste_y = tile_size * (curr_y - min_y)
-                    map_image.paste(tile_image, (paste_x, paste_y))
+        map_image, pasted = render_automap(data, key,
+                                           min_x, min_y, max_x, max_y)
+        has_maps = pasted > 0
 
         if not os.path.isdir(dest_dir):
             os.mkdir(dest_dir)
 
-        new_file = dest_dir + '/' + filename + '_' + str(key).rjust(2,
-                                                                    '0') + '.bmp'
-
         if has_maps:
-            if os.path.isfile(new_file):
-
-                # do not overwrite!
-                add = 1
-                while os.path.isfile(new_file):
-                    new_file = dest_dir + '/' + filename + '_' + \
-                               str(key).rjust(2, '0') + '(' + str(
-                        add) + ').bmp'
-                    add += 1
+            new_file = free_file_name(dest_dir + '/' + filename + '_' +
+                                      str(key).rjust(2, '0'), extension)
 
             num = str(key).rjust(2)
             width = str(tile_size * map_width).rjust(4)
@@ -207,7 +338,9 @@ def stitch_automaps(data, dest_dir='RevAPI_automaps'):
             file = new_file.ljust(20)
             left = str(len(data.keys()) - iteration).rjust(2)
 
-            map_image.save(new_file, 'BMP')
+            wait_for_room(pending)
+            pending.append(save_image(map_image, new_file, output_format,
+                                      compress_level))
 
             print('\t\tAutomap [%s] is done, resolution [%s x %s],'
                   ' [%s] tiles, saved as %s (%s files left)' %
@@ -215,10 +348,12 @@ def stitch_automaps(data, dest_dir='RevAPI_automaps'):
 
             iteration += 1
 
+    wait_for(pending)
     return True
 
 
-def stitch_heatmaps(data, dest_dir='RevAPI_heatmaps'):
+def stitch_heatmaps(data, dest_dir='RevAPI_heatmaps', output_format='bmp',
+                    compress_level=6):
     """
     Whole game world in Revenant is built like a mesh out of small *.dat files.
     Each map file contains data about any objects located there.
@@ -230,70 +365,41 @@ def stitch_heatmaps(data, dest_dir='RevAPI_heatmaps'):
 
     :param data: prepared dictionary from scan_for_files func
     :param dest_dir: destination directory, where to save results
+    :param output_format: 'bmp', 'bmp8', 'png' or 'webp', see save_image func
+    :param compress_level: compression level for png and webp (0-9)
     :return: True if nothing interrupted the process. False if there are any errors.
     """
     if not data:
         return False
 
-    tile_size = 16  # in pixels
+    tile_size = HEATMAP_TILE_SIZE
+    extension = OUTPUT_FORMATS[output_format]
     iteration = 1
+    pending = []
 
     for key in data.keys():
-        has_maps = False
-
         min_x = data[key][1]
         max_x = data[key][2]
         min_y = data[key][3]
         max_y = data[key][4]
         directory = data[key][5]
-        # min_size = data[key][6]
-        max_size = data[key][7]
 
-        filename = directory[:-1]
+        filename = output_name(directory)
 
         map_width = abs(min_x - max_x) + 1
         map_height = abs(min_y - max_y) + 1
 
-        map_image = Image.new('RGB',
-                              (tile_size * map_width, tile_size * map_height),
-                              (32, 32, 32))
-
-        for curr_y in range(min_y, max_y + 1):
-            for curr_x in range(min_x, max_x + 1):
-                tile_file = directory + "%d_%d_%d.dat" % (key, curr_x, curr_y)
-
-                if os.path.isfile(tile_file):
-                    # not all files in allowed range actually exist
-                    has_maps = True
-                    file_size = os.path.getsize(tile_file)
-
-                    delta = 256 / max_size  # minimum size is usually too small to be used
-
-                    color = int(file_size * delta)
-
-                    if color < 16:
-                        color = 16
-
-                    tile_image = Image.new('RGB', (tile_size, tile_size),
-                                           (color, 0, color))  # violet shades
-
-                    paste_x = tile_size * (curr_x - min_x)
-                    paste_y = tile_size * (curr_y - min_y)
-                    map_image.paste(tile_image, (paste_x, paste_y))
+        # violet shades
+        map_image, painted = render_heatmap(data, key,
+                                            min_x, min_y, max_x, max_y)
+        has_maps = painted > 0
 
         if not os.path.isdir(dest_dir):
             os.mkdir(dest_dir)
 
-        new_file = dest_dir + '/' + filename + '_' + str(key).rjust(2,
-                                                                    '0') + '.bmp'
-
         if has_maps:
-            if os.path.isfile(new_file):
-                add = 1
-                while os.path.isfile(new_file):
-                    new_file = dest_dir + '/' + filename + '_' + str(
-                        key).rjust(2, '0') + '(' + str(add) + ').bmp'
-                    add += 1
+            new_file = free_file_name(dest_dir + '/' + filename + '_' +
+                                      str(key).rjust(2, '0'), extension)
 
             num = str(key).rjust(2)
             width = str(tile_size * map_width).rjust(4)
@@ -302,7 +408,9 @@ def stitch_heatmaps(data, dest_dir='RevAPI_heatmaps'):
             file = new_file.ljust(20)
             left = str(len(data.keys()) - iteration).rjust(2)
 
-            map_image.save(new_file, 'BMP')
+            wait_for_room(pending)
+            pending.append(save_image(map_image, new_file, output_format,
+                                      compress_level))
 
             print(
                 '\t\tHeatmap [%s] is done, resolution [%s x %s], [%s] tiles, saved as %s (%s files left)' %
@@ -310,10 +418,12 @@ def stitch_heatmaps(data, dest_dir='RevAPI_heatmaps'):
 
             iteration += 1
 
+    wait_for(pending)
     return True
 
 
-def stitch_progress(source_data, progress_data, dest_dir='RevAPI_progress'):
+def stitch_progress(source_data, progress_data, dest_dir='RevAPI_progress',
+                    output_format='bmp', compress_level=6):
     """
     This function requires already built heatmaps of original level (violet).
     Player's progress will be painted using green heatmaps over given originals.
@@ -322,77 +432,54 @@ def stitch_progress(source_data, progress_data, dest_dir='RevAPI_progress'):
     :param source_data: prepared dictionary from scan_for_files func. This describes default world map
     :param progress_data: prepared dictionary from scan_for_files func. This describes player progress
     :param dest_dir: destination directory, where to save results
+    :param output_format: 'bmp', 'bmp8', 'png' or 'webp', see save_image func
+    :param compress_level: compression level for png and webp (0-9)
     :return: True if nothing interrupted the process. False if there are any errors.
     """
     if not progress_data:
         return False
 
-    tile_size = 16  # in pixels
+    tile_size = HEATMAP_TILE_SIZE
+    extension = OUTPUT_FORMATS[output_format]
     iteration = 1
+    pending = []
 
     for key in progress_data.keys():
-        has_maps = False
-
         min_x = source_data[key][1]
         max_x = source_data[key][2]
         min_y = source_data[key][3]
         max_y = source_data[key][4]
 
         directory = progress_data[key][5]
-        # min_size = progress_data[key][6]
-        max_size = progress_data[key][7]
 
         map_width = abs(min_x - max_x) + 1
         map_height = abs(min_y - max_y) + 1
 
-        filename = directory[:-1]
+        filename = output_name(directory)
 
-        source_file = dest_dir + '/' + source_data[key][5][:-1] + '_' + str(
-            key).rjust(2, '0') + '.bmp'
+        source_file = dest_dir + '/' + output_name(source_data[key][5]) + '_' + str(
+            key).rjust(2, '0') + extension
 
         if os.path.isfile(source_file):
-            map_image = Image.open(source_file)
+            # palette images have to be converted to paint over them
+            with Image.open(source_file) as source_image:
+                map_image = source_image.convert('RGB')
         else:
             map_image = Image.new('RGB', (
-                tile_size * map_width, tile_size * map_height), (32, 32, 32))
-
-        for curr_y in range(min_y, max_y + 1):
-            for curr_x in range(min_x, max_x + 1):
-                tile_file = directory + "%d_%d_%d.dat" % (key, curr_x, curr_y)
-
-                if os.path.isfile(tile_file):
-                    # not all files in allowed range actually exist
-                    has_maps = True
-                    file_size = os.path.getsize(tile_file)
-
-                    delta = 256 / max_size
-
-                    color = int(file_size * delta)
+                tile_size * map_width, tile_size * map_height), BACKGROUND)
 
-                    if color < 16:
-                        color = 16
-
-                    tile_image = Image.new('RGB', (tile_size, tile_size),
-                                           (0, color, 0))  # green shades
-
-                    paste_x = tile_size * (curr_x - min_x)
-                    paste_y = tile_size * (curr_y - min_y)
-                    map_image.paste(tile_image, (paste_x, paste_y))
+        # green shades
+        painted = paint_heatmap(map_image, progress_data, key,
+                                min_x, min_y, max_x, max_y, GREEN)
+        has_maps = painted > 0
 
         if not os.path.isdir(dest_dir):
             os.mkdir(dest_dir)
 
-        new_file = source_file[:-4] + '_' + filename + '_' + str(key).rjust(2,
-                                                                            '0') + '.bmp'
-
         if has_maps:
-            if os.path.isfile(new_file):
-                add = 1
-                while os.path.isfile(new_file):
-                    new_file = source_file[:-4] + '_' + filename + '_' + \
-                               str(key).rjust(2, '0') + '(' + str(
-                        add) + ').bmp'
-                    add += 1
+            new_file = free_file_name(source_file[:-len(extension)] + '_' +
+                                      filename + '_' + str(key).rjust(2, '0'),
+                                      extension)
 
             num = str(key).rjust(2)
             width = str(tile_size * map_width).rjust(4)
@@ -401,7 +488,9 @@ def stitch_progress(source_data, progress_data, dest_dir='RevAPI_progress'):
             file = new_file.ljust(20)
             left = str(len(progress_data.keys()) - iteration).rjust(2)
 
-            map_image.save(new_file, 'BMP')
+            wait_for_room(pending)
+            pending.append(save_image(map_image, new_file, output_format,
+                                      compress_level))
 
             print(
                 '\t\tProgress heatmap [%s] is done, resolution [%s x %s], [%s] tiles, saved as %s (%s files left)' %
@@ -409,10 +498,196 @@ def stitch_progress(source_data, progress_data, dest_dir='RevAPI_progress'):
 
             iteration += 1
 
+    wait_for(pending)
     return True
 
 
-def save_all_automaps(path: str = '', extension: str = 'bmp') -> None:
+def render_region(data, map_id, x0, y0, x1, y1, kind='automaps',
+                  progress_data=None, dest_dir=None, output_format='bmp',
+                  compress_level=6):
+    """
+    Renders arbitrary rectangle of the map without stitching the whole map.
+    Only tiles intersecting the rectangle are loaded, so cost depends
+    on size of the region, not the size of the world.
+
+    :param data: prepared dictionary from scan_for_files func
+                 ('bmp' for automaps, 'dat' for heatmaps and progress)
+    :param map_id: map name
+    :param x0: left border of the region (inclusive)
+    :param y0: top border of the region (inclusive)
+    :param x1: right border of the region (inclusive)
+    :param y1: bottom border of the region (inclusive)
+    :param kind: 'automaps', 'heatmaps' or 'progress'
+    :param progress_data: prepared dictionary from scan_for_files func.
+                          Required only for progress, describes player progress
+    :param dest_dir: where to save result. Result is only returned if not set
+    :param output_format: 'bmp', 'bmp8', 'png' or 'webp', see save_image func
+    :param compress_level: compression level for png and webp (0-9)
+    :return: rendered image. False if there are any errors.
+    """
+    if not data or map_id not in data:
+        print(f'Map [{map_id}] is not found')
+        return False
+
+    if kind == 'progress' and not progress_data:
+        print('Not enough information to show progress. '
+              'Progress directory is empty.')
+        return False
+
+    x0, x1 = min(x0, x1), max(x0, x1)
+    y0, y1 = min(y0, y1), max(y0, y1)
+
+    if kind == 'automaps':
+        map_image, count = render_automap(data, map_id, x0, y0, x1, y1)
+    elif kind == 'heatmaps':
+        map_image, count = render_heatmap(data, map_id, x0, y0, x1, y1)
+    elif kind == 'progress':
+        map_image, count = render_progress(data, progress_data, map_id,
+                                           x0, y0, x1, y1)
+    else:
+        print(f'Unknown kind of image: {kind}')
+        return False
+
+    if dest_dir:
+        if not os.path.isdir(dest_dir):
+            os.mkdir(dest_dir)
+
+        base = dest_dir + '/' + output_name(data[map_id][5]) + '_' + \
+            str(map_id).rjust(2, '0') + '_%d_%d_%d_%d' % (x0, y0, x1, y1)
+
+        if kind == 'progress':
+            progress_dir = next(iter(progress_data.values()))[5]
+            base += '_' + output_name(progress_dir)
+
+        new_file = free_file_name(base, OUTPUT_FORMATS[output_format])
+        wait_for([save_image(map_image, new_file, output_format,
+                             compress_level)])
+
+        print('\t\tRegion of map [%s] is done, resolution [%d x %d],'
+              ' [%d] tiles, saved as %s' %
+              (str(map_id).rjust(2), map_image.width, map_image.height,
+               count, new_file))
+
+    return map_image
+
+
+def split_tile(map_image, data, key, x, y, min_x, min_y, dest_dir,
+               create=False):
+    """
+    Cuts one tile out of stitched automap and saves it if it was changed.
+
+    :param map_image: stitched automap
+    :param data: prepared dictionary from scan_for_files func, original tiles
+    :param key: map name
+    :param x: tile x coordinate
+    :param y: tile y coordinate
+    :param min_x: x coordinate of the top left tile of stitched automap
+    :param min_y: y coordinate of the top left tile of stitched automap
+    :param dest_dir: where to save changed tile, ends with slash
+    :param create: save tile even if there is no original one
+    :return: True if tile was saved
+    """
+    left = AUTOMAP_TILE_SIZE * (x - min_x)
+    top = AUTOMAP_TILE_SIZE * (y - min_y)
+    tile_image = map_image.crop((left, top, left + AUTOMAP_TILE_SIZE,
+                                 top + AUTOMAP_TILE_SIZE))
+    name = "%d_%d_%d.bmp" % (key, x, y)
+
+    try:
+        with profiling.timer('decode'):
+            with Image.open(open_tile(data, key, name)) as original:
+                original.load()
+    except (OSError, KeyError):
+        original = None
+
+    if original is None:
+        # empty cells of stitched automap are black
+        if not create or tile_image.getbbox() is None:
+            return False
+    elif original.convert('RGB').tobytes() == tile_image.tobytes():
+        return False
+    elif original.mode == 'P':
+        tile_image = tile_image.quantize(palette=original, dither=0)
+    elif original.mode != 'RGB':
+        tile_image = tile_image.convert(original.mode)
+
+    with profiling.timer('encode'):
+        tile_image.save(dest_dir + name, 'BMP')
+    profiling.count('files written')
+    return True
+
+
+def split_automap(image_file, data, key, dest_dir=None, create=False,
+                  workers=None):
+    """
+    Cuts edited stitched automap back into name_x_y.bmp tiles.
+    This is the reverse operation of the stitch_automaps func.
+
+    Only tiles that differ from existing tile files are saved.
+
+    :param image_file: stitched automap, for example made by stitch_automaps func
+    :param data: prepared dictionary from scan_for_files func ('bmp' files)
+    :param key: map name
+    :param dest_dir: where to save tiles, original directory if not set
+    :param create: also save tiles for empty cells that were painted
+    :param workers: number of threads for comparing and saving tiles
+    :return: number of saved tiles. False if there are any errors.
+    """
+    if not data or key not in data:
+        print(f'Map [{key}] is not found')
+        return False
+
+    if not os.path.isfile(image_file):
+        print(f'Unable to split, [{image_file}] is not found.')
+        return False
+
+    min_x, max_x, min_y, max_y, directory = data[key][1:6]
+
+    if dest_dir is None:
+        if archives.archive_path(directory) is not None:
+            print('Unable to write tiles into archive, '
+                  'destination directory is required')
+            return False
+        dest_dir = directory
+
+    if dest_dir[-1] != '/' and dest_dir[-1] != '\\':
+        dest_dir = dest_dir + '/'
+
+    if not os.path.isdir(dest_dir):
+        os.makedirs(dest_dir)
+
+    with profiling.timer('decode'):
+        with Image.open(image_file) as source_image:
+            map_image = source_image.convert('RGB')
+
+    expected = (AUTOMAP_TILE_SIZE * (max_x - min_x + 1),
+                AUTOMAP_TILE_SIZE * (max_y - min_y + 1))
+
+    if map_image.size != expected:
+        print('Unable to split, size of [%s] is %d x %d, expected %d x %d' %
+              (image_file, *map_image.size, *expected))
+        return False
+
+    if create:
+        cells = [(x, y) for y in range(min_y, max_y + 1)
+                 for x in range(min_x, max_x + 1)]
+    else:
+        cells = sorted(data[key][8], key=lambda tile: tile[::-1])
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        saved = sum(executor.map(
+            lambda cell: split_tile(map_image, data, key, *cell,
+                                    min_x, min_y, dest_dir, create),
+            cells))
+
+    print('\t\tAutomap [%s] is split, [%d] of [%d] tiles changed, saved in %s' %
+          (str(key).rjust(2), saved, len(cells), dest_dir))
+    return saved
+
+
+def save_all_automaps(path: str = '', extension: str = 'bmp',
+                      output_format: str = 'bmp',
+                      compress_level: int = 6) -> None:
     """Save all automaps including nested directories.
 
     If finds files that fit into template name_x_y.bmp,
@@ -423,11 +698,14 @@ def save_all_automaps(path: str = '', extension: str = 'bmp') -> None:
         extension=extension,
         on_success='Conversion complete. {i} files converted as automaps',
         on_fail='No automap files found in nearby directories',
-        handler=stitch_automaps,
+        handler=partial(stitch_automaps, output_format=output_format,
+                        compress_level=compress_level),
     )
 
 
-def save_all_heatmaps(path: str = '', extension: str = 'dat'):
+def save_all_heatmaps(path: str = '', extension: str = 'dat',
+                      output_format: str = 'bmp',
+                      compress_level: int = 6) -> None:
     """Save all heatmaps including nested directories.
 
     If finds files that fit into template name_x_y.dat,
@@ -439,30 +717,30 @@ def save_all_heatmaps(path: str = '', extension: str = 'dat'):
         on_success='Conversion complete. {i} files converted as heatmaps',
         on_fail=('No suitable to heatmap creation '
                  'files are found in nearby directories'),
-        handler=stitch_heatmaps,
+        handler=partial(stitch_heatmaps, output_format=output_format,
+                        compress_level=compress_level),
     )
 
 
 def save_all(path: str, extension: str, on_success: str,
-             on_fail: str, handler: Callable) -> None:
+             on_fail: str, handler: Callable,
+             workers: Optional[int] = None) -> None:
     """Generic function for automap/heatmap stitching."""
     path = path or os.curdir
 
     i = 0
-    for folder in os.listdir(path):
-        if os.path.isdir(folder):
-            data = scan_for_files(folder, extension)
-            if data:
-                handler(data)
-                i += 1
+    for _, data in scan_folders(discover_folders(path), extension, workers):
+        handler(data)
+        i += 1
 
     if i:
-        print(on_success.format(i))
+        print(on_success.format(i=i))
     else:
         print(on_fail)
 
 
-def show_progress_on_map(source='map', progress='savegame'):
+def show_progress_on_map(source='map', progress='savegame',
+                         output_format='bmp', compress_level=6):
     """
     Guide for the stitch_progress function.
     To make this script work you need two sets of dat files - originals and from save game directory.
@@ -472,6 +750,8 @@ def show_progress_on_map(source='map', progress='savegame'):
 
     :param source: name of the directory that contains original dat files (from non started game)
     :param progress: name of the directory that contains player's progress (dat files from saved game)
+    :param output_format: 'bmp', 'bmp8', 'png' or 'webp', see save_image func
+    :param compress_level: compression level for png and webp (0-9)
     :return: True if nothing interrupted the process. False if there are any errors.
     """
     source_data = scan_for_files(source, 'dat')
@@ -480,11 +760,13 @@ def show_progress_on_map(source='map', progress='savegame'):
     if progress_data and source_data:
 
         source_stitched = stitch_heatmaps(source_data,
-                                          'RevAPI_progress')
+                                          'RevAPI_progress',
+                                          output_format, compress_level)
 
         progress_stitched = stitch_progress(source_data,
                                             progress_data,
-                                            'RevAPI_progress')
+                                            'RevAPI_progress',
+                                            output_format, compress_level)
 
         return source_stitched and progress_stitched
     else:
@@ -502,10 +784,215 @@ def show_progress_on_map(source='map', progress='savegame'):
     return False
 
 
-if __name__ == '__main__':
-    args = sys.argv[1:]
+def render_save_progress(source_data, baseline, index, folder):
+    """
+    Scans one savegame and paints its progress over baseline heatmaps.
+
+    :param source_data: prepared dictionary from scan_for_files func. This describes default world map
+    :param baseline: already rendered heatmaps of default world {map: image}
+    :param index: number of the savegame in the timeline
+    :param folder: directory with dat files of the savegame
+    :return: tuple (index, folder, progress_data, {map: image})
+    """
+    progress_data = scan_for_files(folder, 'dat') or {}
+    images = {}
+
+    for key, map_image in baseline.items():
+        map_image = map_image.copy()
+
+        if key in progress_data:
+            min_x, max_x, min_y, max_y = source_data[key][1:5]
+            paint_heatmap(map_image, progress_data, key,
+                          min_x, min_y, max_x, max_y, GREEN)
 
-    if len(args) < 2 or len(args) > 3:
+        images[key] = map_image
+
+    return index, folder, progress_data, images
+
+
+def timeline_frame(map_image, size=TIMELINE_FRAME_SIZE):
+    """
+    Makes small copy of the image for contact sheet and animation.
+
+    :param map_image: full size image
+    :param size: maximum width and height of the frame
+    :return: new image
+    """
+    scale = min(1.0, size / max(map_image.size))
+    width = max(1, round(map_image.width * scale))
+    height = max(1, round(map_image.height * scale))
+    return map_image.resize((width, height), Image.BOX)
+
+
+def contact_sheet(frames, columns=None, gap=4):
+    """
+    Places images in a grid, left to right, top to bottom.
+
+    :param frames: list of images of the same size
+    :param columns: number of columns, square-ish grid if not set
+    :param gap: space between images in pixels
+    :return: new image
+    """
+    columns = columns or math.ceil(math.sqrt(len(frames)))
+    rows = math.ceil(len(frames) / columns)
+    width, height = frames[0].size
+
+    sheet = Image.new('RGB', (columns * (width + gap) + gap,
+                              rows * (height + gap) + gap), (0, 0, 0))
+
+    for i, frame in enumerate(frames):
+        row, column = divmod(i, columns)
+        sheet.paste(frame, (gap + column * (width + gap),
+                            gap + row * (height + gap)))
+
+    return sheet
+
+
+def show_timeline(source, progress, dest_dir='RevAPI_timeline',
+                  workers=None, output_format='bmp', compress_level=6):
+    """
+    Shows player's progress over many savegames.
+    Original world is scanned and rendered only once, savegames are
+    processed in parallel against that baseline.
+
+    For every map result contains progress image for every savegame,
+    contact sheet and animation with all savegames, and json file with
+    number of the savegame where each tile was visited for the first time.
+
+    :param source: name of the directory that contains original dat files (from non started game)
+    :param progress: ordered list of directories with dat files from saved games
+    :param dest_dir: destination directory, where to save results
+    :param workers: number of threads for savegame processing, also
+                    number of savegames kept in memory at the same time
+    :param output_format: 'bmp', 'bmp8', 'png' or 'webp', see save_image func,
+                          animation is always saved as gif
+    :param compress_level: compression level for png and webp (0-9)
+    :return: first visited indices {map: {(x, y): savegame number}}. False if there are any errors.
+    """
+    source_data = scan_for_files(source, 'dat')
+
+    if not source_data or not progress:
+        print('Not enough information to show timeline. No input data.')
+        return False
+
+    baseline = {}
+    for key in source_data:
+        min_x, max_x, min_y, max_y = source_data[key][1:5]
+        baseline[key], _ = render_heatmap(source_data, key,
+                                          min_x, min_y, max_x, max_y)
+
+    if not os.path.isdir(dest_dir):
+        os.mkdir(dest_dir)
+
+    name = output_name(source_data[next(iter(source_data))][5])
+    extension = OUTPUT_FORMATS[output_format]
+    first_visited = {key: {} for key in source_data}
+    frames = {key: [] for key in source_data}
+    writing = []
+
+    def save_results(result):
+        index, folder, progress_data, images = result
+
+        # images of previous savegame have to be written before
+        # taking new ones, so they don't pile up in encoder queue
+        wait_for(writing)
+        writing.clear()
+
+        for key in progress_data:
+            if key not in first_visited:
+                continue
+            for tile in progress_data[key][8]:
+                first_visited[key].setdefault(tile, index)
+
+        # only small frames are kept, full size images are saved and dropped
+        for key, map_image in images.items():
+            frames[key].append(timeline_frame(map_image))
+            base = dest_dir + '/' + name + '_' + str(key).rjust(2, '0') + \
+                '_' + str(index).rjust(3, '0') + '_' + output_name(folder)
+
+            writing.append(save_image(map_image,
+                                      free_file_name(base, extension),
+                                      output_format, compress_level))
+
+    workers = workers or os.cpu_count() or 1
+    pending = deque()
+
+    # results are taken in order, so first visits are collected
+    # incrementally, and only a few savegames are rendered ahead
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for index, folder in enumerate(progress):
+            pending.append(executor.submit(render_save_progress, source_data,
+                                           baseline, index, folder))
+            if len(pending) >= workers:
+                save_results(pending.popleft().result())
+
+        while pending:
+            save_results(pending.popleft().result())
+
+    for key, map_frames in frames.items():
+        base = dest_dir + '/' + name + '_' + str(key).rjust(2, '0')
+
+        writing.append(save_image(contact_sheet(map_frames),
+                                  free_file_name(base + '_sheet', extension),
+                                  output_format, compress_level))
+
+        with profiling.timer('encode'):
+            map_frames[0].save(free_file_name(base + '_timeline', '.gif'),
+                               'GIF', save_all=True,
+                               append_images=map_frames[1:],
+                               duration=500, loop=0)
+
+        print('\t\tTimeline of map [%s] is done, [%d] savegames, '
+              '[%d] visited tiles' % (str(key).rjust(2), len(map_frames),
+                                      len(first_visited[key])))
+
+    wait_for(writing)
+
+    report = {
+        'savegames': list(progress),
+        'first_visited': {
+            str(key): {'%d_%d' % tile: index
+                       for tile, index in sorted(tiles.items())}
+            for key, tiles in first_visited.items()
+        },
+    }
+
+    with open(free_file_name(dest_dir + '/' + name + '_first_visited',
+                             '.json'), 'w') as file:
+        json.dump(report, file, indent=2)
+
+    return first_visited
+
+
+def main(args):
+    """Command line interface, see README.md for examples."""
+    output_format = 'bmp'
+    compress_level = 6
+    format_options = '--format' in args or '--compress' in args
+
+    if '--format' in args:
+        i = args.index('--format')
+        output_format = args[i + 1].lower() if i + 1 < len(args) else ''
+        args = args[:i] + args[i + 2:] if output_format else []
+
+        if output_format and output_format not in OUTPUT_FORMATS:
+            print(f'Unknown output format: {output_format}, '
+                  f'possible formats: {", ".join(OUTPUT_FORMATS)}')
+            sys.exit()
+
+    if '--compress' in args:
+        i = args.index('--compress')
+        level = args[i + 1] if i + 1 < len(args) else ''
+        args = args[:i] + args[i + 2:]
+
+        if level.isdigit() and int(level) <= 9:
+            compress_level = int(level)
+        else:
+            args = []
+
+    if len(args) < 2 or (len(args) > 3
+                         and args[0].lower() not in ('region', 'timeline',
+                                                     'split')):
         print('You need to specify mode to run this script')
         print()
         print('Possible examples:')
@@ -514,6 +1001,18 @@ if __name__ == '__main__':
         print('python automaps.py heatmaps *')
         print('python automaps.py heatmaps my_dir')
         print('python automaps.py progress src1_dir src2_dir')
+        print('python automaps.py region automaps my_dir map x0 y0 x1 y1')
+        print('python automaps.py region heatmaps my_dir map x0 y0 x1 y1')
+        print('python automaps.py region progress src1_dir map x0 y0 x1 y1 '
+              'src2_dir')
+        print('python automaps.py timeline src_dir save1_dir save2_dir ...')
+        print('python automaps.py split stitched.bmp tiles_dir map [dest_dir]')
+        print()
+        print('Add --format bmp|bmp8|png|webp to choose output format, '
+              '--compress 0-9 to choose compression level for png and webp')
+        print('Add --profile to see time spent on each stage, '
+              '--profile-dump file.prof to save cProfile dump, '
+              '--report file.json to save json report')
         sys.exit()
 
     mode, directory, *rest = args
@@ -523,19 +1022,60 @@ if __name__ == '__main__':
 
     if mode == 'heatmaps':
         if directory == '*':
-            save_all_heatmaps()
-        else:
-            save_all_heatmaps(directory)
+            directory = ''
+        save_all_heatmaps(directory, output_format=output_format,
+                          compress_level=compress_level)
 
     elif mode == 'automaps':
         if directory == '*':
-            save_all_automaps()
-        else:
-            save_all_automaps(directory)
+            directory = ''
+        save_all_automaps(directory, output_format=output_format,
+                          compress_level=compress_level)
 
     elif mode == 'progress':
-        source, target, *_ = rest
-        show_progress_on_map(source, target)
+        target, *_ = rest
+        show_progress_on_map(directory, target, output_format,
+                             compress_level)
+
+    elif mode == 'split':
+        if format_options:
+            print('Split mode writes bmp tiles, '
+                  '--format and --compress are not supported')
+            sys.exit()
+
+        source, map_id, *destination = rest
+        split_automap(directory, scan_for_files(source, 'bmp'), int(map_id),
+                      destination[0] if destination else None)
+
+    elif mode == 'timeline':
+        show_timeline(directory, rest, output_format=output_format,
+                      compress_level=compress_level)
+
+    elif mode == 'region':
+        kind = directory.lower()
+        source, map_id, x0, y0, x1, y1, *progress = rest
+        map_id = int(map_id)
+        box = (int(x0), int(y0), int(x1), int(y1))
+        extension = 'bmp' if kind == 'automaps' else 'dat'
+        progress_data = None
+
+        # brightness of heatmaps depends on the biggest file of the map,
+        # so only automaps are limited by the box
+        scan_box = box if kind == 'automaps' else None
+
+        if progress:
+            progress_data = scan_for_files(progress[0], extension,
+                                           key=map_id)
+
+        render_region(scan_for_files(source, extension, key=map_id,
+                                     box=scan_box),
+                      map_id, *box, kind, progress_data, 'RevAPI_regions',
+                      output_format, compress_level)
 
     else:
         print(f'Arguments are not recognised: {args}')
+
+
+if __name__ == '__main__':
+    arguments, profile_options = profiling.parse_args(sys.argv[1:])
+    profiling.run(main, profile_options, arguments)
@@ -0,0 +1,351 @@
+"""Benchmarks for map processing.
+
+This module generates synthetic game world (automap tiles, map dat files
+and savegame dat files) and measures how long it takes to scan and stitch it.
+For every stage it records time, peak memory and counters collected by
+profiling module (files read, stat calls, etc.). On Linux number of read
+and write system calls is also taken from /proc/self/io and peak resident
+memory of every stage (including PIL image buffers) from /proc/self/status.
+
+Results are saved as json, so they can be compared with previous runs:
+
+    python benchmark.py --maps 4 --size 64 --output before.json
+    python benchmark.py --maps 4 --size 64 --baseline before.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from PIL import Image
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+try:
+    from revenant import automaps, profiling
+except ImportError:  # launched as a script from revenant directory
+    import automaps
+    import profiling
+
+# names of tiles are limited by three letters, including minus sign
+MAX_GRID_SIZE = 198
+
+
+def _random_bytes(rng, length):
+    """Random bytes from given generator."""
+    return rng.getrandbits(8 * length).to_bytes(length, 'little')
+
+
+def generate_world(directory, maps=2, size=32, sparsity=0.3,
+                   duplicates=0.5, progress=0.3, seed=0):
+    """
+    Creates synthetic world in given directory.
+
+    :param directory: where to create 'automaps', 'map' and 'savegame' folders
+    :param maps: number of maps
+    :param size: width and height of every map in tiles
+    :param sparsity: share of empty cells in the grid (0.0 - 1.0)
+    :param duplicates: share of tiles that are copies of other tiles (0.0 - 1.0)
+    :param progress: share of map tiles that also exist in the savegame
+    :param seed: seed for random generator, same seed gives same world
+    :return: dictionary with number of created files and bytes
+    """
+    rng = random.Random(seed)
+    folders = {name: os.path.join(directory, name)
+               for name in ('automaps', 'map', 'savegame')}
+
+    for folder in folders.values():
+        os.makedirs(folder, exist_ok=True)
+
+    first = -(size // 2)
+    tile_bytes = automaps.AUTOMAP_TILE_SIZE * automaps.AUTOMAP_TILE_SIZE * 3
+    created = {'tiles': 0, 'files': 0, 'bytes': 0}
+    bmp_pool = []
+    dat_pool = []
+
+    for key in range(1, maps + 1):
+        for y in range(first, first + size):
+            for x in range(first, first + size):
+                if rng.random() < sparsity:
+                    continue
+
+                if bmp_pool and rng.random() < duplicates:
+                    bmp = rng.choice(bmp_pool)
+                    dat = rng.choice(dat_pool)
+                else:
+                    image = Image.frombytes(
+                        'RGB', (automaps.AUTOMAP_TILE_SIZE,
+                                automaps.AUTOMAP_TILE_SIZE),
+                        _random_bytes(rng, tile_bytes))
+                    buffer = io.BytesIO()
+                    image.save(buffer, 'BMP')
+                    bmp = buffer.getvalue()
+                    dat = _random_bytes(rng,
+                                        int(rng.expovariate(1 / 4096)) + 64)
+                    bmp_pool.append(bmp)
+                    dat_pool.append(dat)
+
+                name = '%d_%d_%d' % (key, x, y)
+                files = [(folders['automaps'], name + '.bmp', bmp),
+                         (folders['map'], name + '.dat', dat)]
+
+                if rng.random() < progress:
+                    files.append((folders['savegame'], name + '.dat',
+                                  dat[:rng.randint(1, len(dat))]))
+
+                for folder, filename, payload in files:
+                    with open(os.path.join(folder, filename), 'wb') as file:
+                        file.write(payload)
+                    created['files'] += 1
+                    created['bytes'] += len(payload)
+
+                created['tiles'] += 1
+
+    return created
+
+
+def _syscalls():
+    """Read and write system calls made by this process (Linux only)."""
+    try:
+        with open('/proc/self/io') as file:
+            fields = dict(line.split(':') for line in file)
+    except OSError:
+        return {}
+    return {'read syscalls': int(fields['syscr']),
+            'write syscalls': int(fields['syscw'])}
+
+
+def _resident_memory():
+    """Current and peak resident memory of this process in KB (Linux only)."""
+    try:
+        with open('/proc/self/status') as file:
+            fields = dict(line.split(':', 1) for line in file)
+    except OSError:
+        return None, None
+    return (int(fields['VmRSS'].split()[0]),
+            int(fields['VmHWM'].split()[0]))
+
+
+def _reset_peak_memory():
+    """Start counting peak resident memory from now (Linux only)."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as file:
+            file.write('5')
+    except OSError:
+        return False
+    return True
+
+
+def measure(func, repeat=3, setup=None):
+    """
+    Runs function several times and measures it.
+    Time is measured in separate runs, memory tracing slows them down a lot.
+
+    :param func: function without arguments, called before every run
+                 with fresh profiling counters
+    :param repeat: how many times to run for timings
+    :param setup: function without arguments, called before every run,
+                  not measured
+    :return: dictionary with timings, peak memory and counters of last run
+    """
+    setup = setup or (lambda: None)
+    timings = []
+    counters = {}
+
+    for _ in range(repeat):
+        setup()
+        profiling.reset()
+        before = _syscalls()
+        started = time.perf_counter()
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            func()
+
+        timings.append(time.perf_counter() - started)
+        after = _syscalls()
+
+        counters = profiling.report()['counters']
+        for name in after:
+            counters[name] = after[name] - before[name]
+
+    # whole memory of the process, C buffers of PIL images included
+    peak_rss = rss_growth = None
+    setup()
+    if _reset_peak_memory():
+        before, _ = _resident_memory()
+        with contextlib.redirect_stdout(io.StringIO()):
+            func()
+        _, peak_rss = _resident_memory()
+        rss_growth = peak_rss - before
+
+    # only memory allocated by python code
+    setup()
+    tracemalloc.start()
+    with contextlib.redirect_stdout(io.StringIO()):
+        func()
+    python_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        'min_seconds': round(min(timings), 6),
+        'median_seconds': round(statistics.median(timings), 6),
+        'peak_rss_kb': peak_rss,
+        'rss_growth_kb': rss_growth,
+        'python_peak_bytes': python_peak,
+        'counters': counters,
+    }
+
+
+def run_benchmarks(directory, repeat=3):
+    """
+    Measures every stage of map processing on generated world.
+
+    :param directory: directory with generated world
+    :param repeat: how many times to run each stage
+    :return: dictionary {stage: measurements}
+    """
+    automaps_dir = os.path.join(directory, 'automaps')
+    map_dir = os.path.join(directory, 'map')
+    savegame_dir = os.path.join(directory, 'savegame')
+    output = os.path.join(directory, 'output')
+    progress_output = os.path.join(directory, 'progress_output')
+
+    def clean_output():
+        shutil.rmtree(output, ignore_errors=True)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        bmp_data = automaps.scan_for_files(automaps_dir, 'bmp')
+        dat_data = automaps.scan_for_files(map_dir, 'dat')
+        progress_data = automaps.scan_for_files(savegame_dir, 'dat')
+
+        # progress is painted over source heatmaps, they are rendered once
+        automaps.stitch_heatmaps(dat_data, progress_output)
+        heatmaps = set(os.listdir(progress_output))
+
+    def clean_progress():
+        for name in os.listdir(progress_output):
+            if name not in heatmaps:
+                os.remove(os.path.join(progress_output, name))
+
+    # stage -> (setup, function)
+    stages = {
+        'scan_for_files bmp': (None, lambda: automaps.scan_for_files(
+            automaps_dir, 'bmp')),
+        'scan_for_files dat': (None, lambda: automaps.scan_for_files(
+            map_dir, 'dat')),
+        'stitch_automaps': (clean_output, lambda: automaps.stitch_automaps(
+            bmp_data, output)),
+        'stitch_heatmaps': (clean_output, lambda: automaps.stitch_heatmaps(
+            dat_data, output)),
+        'stitch_progress': (clean_progress, lambda: automaps.stitch_progress(
+            dat_data, progress_data, progress_output)),
+    }
+
+    results = {}
+    for name, (setup, func) in stages.items():
+        print('Measuring %s...' % name)
+        results[name] = measure(func, repeat, setup)
+
+    clean_output()
+    shutil.rmtree(progress_output, ignore_errors=True)
+    return results
+
+
+def compare(results, baseline):
+    """Print difference between current results and baseline."""
+    for field, title in (('median_seconds', 'seconds'),
+                         ('rss_growth_kb', 'rss growth, KB')):
+        print()
+        print('%-20s %12s %12s %8s  (%s)' %
+              ('Stage', 'baseline', 'current', 'ratio', title))
+        for name, stage in results['stages'].items():
+            old = baseline.get('stages', {}).get(name, {})
+            current = stage.get(field)
+            before = old.get(field)
+            if current is None or before is None or not before:
+                print('%-20s %12s %12s %8s' % (name, before, current, '-'))
+                continue
+            print('%-20s %12.4f %12.4f %7.2fx' %
+                  (name, before, current, current / before))
+
+
+def main():
+    """Command line interface."""
+    parser = argparse.ArgumentParser(description='Map processing benchmarks')
+    parser.add_argument('--maps', type=int, default=2)
+    parser.add_argument('--size', type=int, default=32,
+                        help='width and height of every map in tiles')
+    parser.add_argument('--sparsity', type=float, default=0.3,
+                        help='share of empty cells')
+    parser.add_argument('--duplicates', type=float, default=0.5,
+                        help='share of duplicated tiles')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='where to save json results')
+    parser.add_argument('--baseline', help='json results to compare with')
+    parser.add_argument('--keep', help='generate world into this directory '
+                                       'and do not delete it')
+    args = parser.parse_args()
+
+    if not 1 <= args.size <= MAX_GRID_SIZE:
+        parser.error(f'--size must be between 1 and {MAX_GRID_SIZE}')
+
+    if not 1 <= args.maps <= 999:
+        parser.error('--maps must be between 1 and 999')
+
+    directory = args.keep or tempfile.mkdtemp(prefix='revenant_bench_')
+    world = {
+        'maps': args.maps,
+        'size': args.size,
+        'sparsity': args.sparsity,
+        'duplicates': args.duplicates,
+        'seed': args.seed,
+    }
+
+    try:
+        print('Generating world in "%s"...' % directory)
+        world.update(generate_world(directory, args.maps, args.size,
+                                    args.sparsity, args.duplicates,
+                                    seed=args.seed))
+        stages = run_benchmarks(directory, args.repeat)
+    finally:
+        if not args.keep:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    results = {
+        'world': world,
+        'python': sys.version.split()[0],
+        'platform': sys.platform,
+        'max_rss_kb': (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                       if resource is not None else None),
+        'stages': stages,
+    }
+
+    for name, stage in stages.items():
+        print('%-20s %10.4f s  %10s KB rss growth  %12d bytes python peak' %
+              (name, stage['median_seconds'], stage['rss_growth_kb'],
+               stage['python_peak_bytes']))
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            compare(results, json.load(file))
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+        print('Results saved as [%s]' % args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,417 @@
+"""Persistent tile catalog.
+
+This module keeps information about scanned tiles (install, folder,
+map, x, y, size, mtime, hash) in a local SQLite file. Every query
+after that is an index lookup instead of a directory walk.
+
+Catalog is refreshed incrementally: folder is rescanned only when its
+mtime differs from the stored one, and only new or changed files
+are read to calculate hashes. Note that editing a file in place does not
+change mtime of its folder, use full refresh to catch such changes.
+
+Refresh catalog for the game install:
+
+    python catalog.py refresh original path/to/game
+    python catalog.py refresh modded path/to/modded/game
+
+Queries:
+
+    python catalog.py maps original
+    python catalog.py bounds original 12
+    python catalog.py largest original 7 10
+    python catalog.py changed original modded
+
+Stitch images using catalog instead of scanning:
+
+    python catalog.py automaps original path/to/game/automaps
+    python catalog.py heatmaps original path/to/game/map
+    python catalog.py progress original path/to/game/map path/to/game/savegame
+"""
+import hashlib
+import os.path
+import sqlite3
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from revenant import archives, tiles
+except ImportError:  # launched as a script from revenant directory
+    import archives
+    import tiles
+
+CATALOG_FILE = 'RevAPI_catalog.sqlite'
+EXTENSIONS = ('bmp', 'dat')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS installs (
+    install TEXT PRIMARY KEY,
+    root TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS folders (
+    install TEXT NOT NULL,
+    folder TEXT NOT NULL,
+    mtime INTEGER NOT NULL,
+    PRIMARY KEY (install, folder)
+);
+CREATE TABLE IF NOT EXISTS tiles (
+    install TEXT NOT NULL,
+    folder TEXT NOT NULL,
+    extension TEXT NOT NULL,
+    map_id INTEGER NOT NULL,
+    x INTEGER NOT NULL,
+    y INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime INTEGER NOT NULL,
+    hash TEXT,
+    PRIMARY KEY (install, folder, extension, map_id, x, y)
+);
+CREATE INDEX IF NOT EXISTS tiles_by_map
+    ON tiles (install, map_id, extension, x, y);
+'''
+
+
+def list_folder(folder):
+    """
+    Lists name_x_y files of one folder (or archive) with their sizes and mtimes.
+
+    :param folder: path to folder or archive
+    :return: dictionary {(extension, map, x, y): (size, mtime)}
+    """
+    found = {}
+    archive = archives.archive_path(folder)
+
+    if archive is not None:
+        # files inside of the archive change only with the archive itself
+        try:
+            mtime = os.stat(archive).st_mtime_ns
+            entries = [(name, size, mtime)
+                       for name, size in archives.list_files(folder).items()]
+        except archives.DuplicateNamesError as error:
+            print(error)
+            return found
+    else:
+        entries = []
+        try:
+            with os.scandir(folder) as iterator:
+                for entry in iterator:
+                    if entry.name[-3:].lower() in EXTENSIONS \
+                            and entry.is_file():
+                        stat = entry.stat()
+                        entries.append((entry.name, stat.st_size,
+                                        stat.st_mtime_ns))
+        except OSError:
+            return found
+
+    for name, size, mtime in entries:
+        extension = name[-3:].lower()
+        if extension not in EXTENSIONS:
+            continue
+
+        name_x_y = tiles.parse_tile_name(name)
+        if name_x_y:
+            found[(extension, *name_x_y)] = (size, mtime)
+
+    return found
+
+
+def hash_file(source, name):
+    """Hash of the file contents.
+
+    :param source: folder resolved by archives.resolve func
+    :param name: base name of the file
+    """
+    source = source.open(name)
+
+    if isinstance(source, str):
+        with open(source, 'rb') as file:
+            payload = file.read()
+    else:
+        payload = source.read()
+
+    return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+
+class Catalog:
+    """SQLite file with information about tiles of many installs."""
+
+    def __init__(self, filename=CATALOG_FILE):
+        self.filename = filename
+        self.connection = sqlite3.connect(filename)
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        """Close database file."""
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def refresh(self, install, root, full=False, workers=None):
+        """
+        Updates catalog for the install.
+
+        :param install: name of the install, like 'original' or 'modded'
+        :param root: directory (or archive) with game files
+        :param full: rescan every folder, even if its mtime did not change
+        :param workers: number of threads for listing folders
+        :return: dictionary with statistics of the refresh
+        """
+        root = os.path.abspath(root)
+        db = self.connection
+        stats = {'folders': 0, 'rescanned': 0, 'added': 0,
+                 'changed': 0, 'removed': 0}
+
+        stored = dict(db.execute(
+            'SELECT folder, mtime FROM folders WHERE install = ?',
+            (install,)))
+
+        outdated = []
+        current = set()
+        for folder in tiles.discover_folders(root):
+            relative = os.path.relpath(folder, root)
+            try:
+                # folders inside of the archive change with the archive
+                mtime = os.stat(archives.archive_path(folder)
+                                or folder).st_mtime_ns
+            except OSError:
+                continue
+
+            current.add(relative)
+            if full or stored.get(relative) != mtime:
+                outdated.append((relative, folder, mtime))
+
+        stats['folders'] = len(current)
+        stats['rescanned'] = len(outdated)
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            listings = list(executor.map(lambda args: list_folder(args[1]),
+                                         outdated))
+
+        with db:
+            db.execute('INSERT OR REPLACE INTO installs VALUES (?, ?)',
+                       (install, root))
+
+            for folder in set(stored) - current:
+                stats['removed'] += db.execute(
+                    'DELETE FROM tiles WHERE install = ? AND folder = ?',
+                    (install, folder)).rowcount
+                db.execute(
+                    'DELETE FROM folders WHERE install = ? AND folder = ?',
+                    (install, folder))
+
+            for (relative, folder, mtime), found in zip(outdated, listings):
+                self._refresh_folder(install, relative, folder, found, stats)
+                db.execute('INSERT OR REPLACE INTO folders VALUES (?, ?, ?)',
+                           (install, relative, mtime))
+
+        return stats
+
+    def _refresh_folder(self, install, relative, folder, found, stats):
+        """Synchronize tiles of one folder with its listing."""
+        db = self.connection
+        known = {
+            (extension, map_id, x, y): (size, mtime)
+            for extension, map_id, x, y, size, mtime in db.execute(
+                'SELECT extension, map_id, x, y, size, mtime FROM tiles '
+                'WHERE install = ? AND folder = ?', (install, relative))
+        }
+
+        for key in set(known) - set(found):
+            db.execute('DELETE FROM tiles WHERE install = ? AND folder = ? '
+                       'AND extension = ? AND map_id = ? AND x = ? AND y = ?',
+                       (install, relative, *key))
+            stats['removed'] += 1
+
+        source = None
+        for key, (size, mtime) in found.items():
+            if known.get(key) == (size, mtime):
+                continue
+
+            # folder (or archive) is resolved once for all changed files
+            if source is None:
+                source = archives.resolve(folder.rstrip('/\\') + '/')
+
+            stats['changed' if key in known else 'added'] += 1
+            extension, map_id, x, y = key
+            digest = hash_file(source, '%d_%d_%d.%s' %
+                               (map_id, x, y, extension))
+            db.execute('INSERT OR REPLACE INTO tiles '
+                       'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                       (install, relative, extension, map_id, x, y,
+                        size, mtime, digest))
+
+    def root(self, install):
+        """Root directory of the install or None if it is unknown."""
+        row = self.connection.execute(
+            'SELECT root FROM installs WHERE install = ?',
+            (install,)).fetchone()
+        return row[0] if row else None
+
+    def data(self, install, folder, extension):
+        """
+        Builds the same dictionary as scan_for_files func, but from catalog.
+        Result can be passed to stitching functions.
+
+        :param install: name of the install
+        :param folder: folder inside of the install (or full path to it)
+        :param extension: 'bmp' or 'dat'
+        :return: dictionary with found sequences. False if nothing found
+        """
+        root = self.root(install)
+        if root is None:
+            return False
+
+        if os.path.exists(folder) or archives.archive_path(folder):
+            relative = os.path.relpath(os.path.abspath(folder), root)
+        else:
+            relative = folder
+
+        rows = self.connection.execute(
+            'SELECT map_id, x, y, size FROM tiles '
+            'WHERE install = ? AND folder = ? AND extension = ?',
+            (install, os.path.normpath(relative), extension)).fetchall()
+
+        # stitching functions name results after this path
+        directory = os.path.relpath(os.path.join(root, relative))
+        return tiles.group_tiles([list(row) for row in rows],
+                                 directory + '/') or False
+
+    def maps(self, install, extension=None):
+        """
+        Describes all maps of the install.
+
+        :return: list of (folder, extension, map, tiles, min_x, max_x,
+                 min_y, max_y, min_size, max_size) tuples
+        """
+        return self.connection.execute(
+            'SELECT folder, extension, map_id, COUNT(*), MIN(x), MAX(x), '
+            'MIN(y), MAX(y), MIN(size), MAX(size) FROM tiles '
+            'WHERE install = ? AND (? IS NULL OR extension = ?) '
+            'GROUP BY folder, extension, map_id '
+            'ORDER BY folder, extension, map_id',
+            (install, extension, extension)).fetchall()
+
+    def bounds(self, install, map_id, extension='dat'):
+        """
+        Bounds of the map.
+
+        :return: tuple (min_x, max_x, min_y, max_y) or None if map is unknown
+        """
+        row = self.connection.execute(
+            'SELECT MIN(x), MAX(x), MIN(y), MAX(y) FROM tiles '
+            'WHERE install = ? AND map_id = ? AND extension = ?',
+            (install, map_id, extension)).fetchone()
+        return row if row[0] is not None else None
+
+    def largest(self, install, map_id, limit=10, extension='dat'):
+        """
+        Biggest tiles of the map.
+
+        :return: list of (folder, x, y, size) tuples
+        """
+        return self.connection.execute(
+            'SELECT folder, x, y, size FROM tiles '
+            'WHERE install = ? AND map_id = ? AND extension = ? '
+            'ORDER BY size DESC LIMIT ?',
+            (install, map_id, extension, limit)).fetchall()
+
+    def changed_maps(self, install, other, extension='dat'):
+        """
+        Maps that differ between two installs (by contents of their tiles).
+
+        :return: sorted list of map names
+        """
+        query = ('SELECT map_id, folder, x, y, hash FROM tiles '
+                 'WHERE install = ? AND extension = ?')
+        rows = self.connection.execute(
+            'SELECT DISTINCT map_id FROM ('
+            f'{query} EXCEPT {query}) UNION SELECT DISTINCT map_id FROM ('
+            f'{query} EXCEPT {query}) ORDER BY map_id',
+            (install, extension, other, extension,
+             other, extension, install, extension)).fetchall()
+        return [row[0] for row in rows]
+
+
+def main(args):
+    """Command line interface, see module docstring for examples."""
+    if len(args) < 2:
+        print('You need to specify command and install to run this script')
+        print()
+        print('Possible examples:')
+        print('python catalog.py refresh install_name game_dir [--full]')
+        print('python catalog.py maps install_name')
+        print('python catalog.py bounds install_name map')
+        print('python catalog.py largest install_name map [count]')
+        print('python catalog.py changed install_name other_install_name')
+        print('python catalog.py automaps install_name automaps_dir')
+        print('python catalog.py heatmaps install_name maps_dir')
+        print('python catalog.py progress install_name src1_dir src2_dir')
+        sys.exit()
+
+    command, install, *rest = args
+    command = command.lower()
+
+    with Catalog() as catalog:
+        if command == 'refresh':
+            stats = catalog.refresh(install, rest[0], full='--full' in rest)
+            print('Catalog of [%s] is refreshed: %d folders, %d rescanned, '
+                  '%d tiles added, %d changed, %d removed' %
+                  (install, stats['folders'], stats['rescanned'],
+                   stats['added'], stats['changed'], stats['removed']))
+
+        elif command == 'maps':
+            for row in catalog.maps(install):
+                print('%-30s %s map [%3d]: [%4d] tiles, x %d..%d, y %d..%d, '
+                      'sizes %d..%d' % row)
+
+        elif command == 'bounds':
+            bounds = catalog.bounds(install, int(rest[0]))
+            if bounds is None:
+                print(f'Map [{rest[0]}] is not found')
+            else:
+                print('Map [%s]: x %d..%d, y %d..%d' % (rest[0], *bounds))
+
+        elif command == 'largest':
+            limit = int(rest[1]) if len(rest) > 1 else 10
+            for folder, x, y, size in catalog.largest(install, int(rest[0]),
+                                                      limit):
+                print('%s/%s_%d_%d.dat %d bytes' % (folder, rest[0], x, y,
+                                                    size))
+
+        elif command == 'changed':
+            changed = catalog.changed_maps(install, rest[0])
+            print('Changed maps: %s' % (', '.join(map(str, changed))
+                                        or 'none'))
+
+        elif command in ('automaps', 'heatmaps', 'progress'):
+            try:
+                from revenant import automaps
+            except ImportError:  # launched as a script from revenant directory
+                import automaps
+
+            extension = 'bmp' if command == 'automaps' else 'dat'
+            data = catalog.data(install, rest[0], extension)
+
+            if command == 'automaps':
+                automaps.stitch_automaps(data)
+            elif command == 'heatmaps':
+                automaps.stitch_heatmaps(data)
+            else:
+                progress_data = catalog.data(install, rest[1], extension)
+                if data and progress_data:
+                    automaps.stitch_heatmaps(data, 'RevAPI_progress')
+                    automaps.stitch_progress(data, progress_data,
+                                             'RevAPI_progress')
+                else:
+                    print('Not enough information to show progress. '
+                          'No input data.')
+
+        else:
+            print(f'Arguments are not recognised: {args}')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -32,11 +32,24 @@
     Simplest way to do that - extract with dat_to_bmp func, change files you need, and repack it back.
     
     insert_bmp_into_dat('menus.dat')
+    
+    Example 4: keep all images in one uncompressed zip file instead of loose bmp files
+    
+    export_to_container('RevAPI_resources.zip')
+    import_from_container('RevAPI_resources.zip')
 """
+import io
 import os.path
 import sys
 
-from PIL import Image
+try:
+    from revenant import archives, profiling
+except ImportError:  # launched as a script from revenant directory
+    import archives
+    import profiling
+
+KNOWN_FILE = os.path.join(os.pardir, 'known.txt')
+CONTAINER_FILE = 'RevAPI_resources.zip'
 
 
 def pack_color(rgb_color):
@@ -87,14 +100,15 @@ def unpack_color(rev_color_a, rev_color_b):
     return red, green, blue
 
 
-def get_known_files():
+def get_known_files(known_file=KNOWN_FILE, verbose=True):
     """
     Loads already known files from known.txt
     Syntax is [name.dat] [start] [width] [height] [postfix]
 
+    :param known_file: path to known.txt
+    :param verbose: print message if file is not found
     :return: list of known files
     """
-    known_file = '..\\known.txt'
     known = []
     if os.path.isfile(known_file):
         with open(known_file) as file:
@@ -108,11 +122,79 @@ def get_known_files():
                 else:
                     continue
     else:
-        print('known.txt file is not found')
+        if verbose:
+            print('known.txt file is not found')
         return False
     return known
 
 
+def decode_image(raw_data, start, width, height):
+    """
+    Decodes image from contents of dat file.
+
+    :param raw_data: contents of dat file
+    :param start: where pixels of the image start
+    :param width: width of the image
+    :param height: height of the image
+    :return: RGB image
+    """
+    from PIL import Image  # heavy, imported only when needed
+
+    bmp_image = Image.new('RGB', (width, height), (0, 0, 0))
+
+    with profiling.timer('decode'):
+        data = []
+        i = 0
+        # skipping header of the file
+        for chunk in raw_data:
+            if i >= start:  # pixels start on this position
+                data.append(int(chunk))
+            else:
+                i += 1
+        i = 0
+        for img_y in range(0, height):
+            for img_x in range(0, width):
+                if i + 3 < len(data):
+                    rgb_color = unpack_color(data[i], data[i + 1])
+                    bmp_image.putpixel((img_x, img_y), rgb_color)
+                    i += 2  # one bmp pixel is two bytes in game's pixels
+                else:
+                    break
+        profiling.count('pixels decoded', i // 2)
+
+    return bmp_image
+
+
+def merge_image(raw_data, start, bmp_data):
+    """
+    Puts pixels of the image into contents of dat file.
+
+    :param raw_data: contents of dat file
+    :param start: where pixels of the image start
+    :param bmp_data: list of RGB pixels of the image
+    :return: new contents of dat file
+    """
+    with profiling.timer('encode'):
+        data = []
+
+        new_pixels = len(bmp_data)
+        pixel_space = 0
+
+        for i in range(0, len(raw_data), 2):
+            if start <= i < (
+                    start + new_pixels * 2):  # one bmp pixel is two bytes in game's pixels
+                color = pack_color(bmp_data[pixel_space])
+                data.append(color[0])
+                data.append(color[1])
+                pixel_space += 1
+            else:
+                data.append(raw_data[i])
+                data.append(raw_data[i + 1])
+        profiling.count('pixels encoded', pixel_space)
+
+    return bytearray(data)
+
+
 def dat_to_bmp(filename, postfix='main'):
     """
     Extracts pixel data from dat file and saves it as bmp file
@@ -121,7 +203,6 @@ def dat_to_bmp(filename, postfix='main'):
     :param postfix: specified sub image (buttons, load bars, etc.)
     :return:  True if result saved, False if not
     """
-
     if not os.path.isfile(filename):
         print('Unable to start conversion, [%s] is not found.' % filename)
         return False
@@ -130,7 +211,7 @@ def dat_to_bmp(filename, postfix='main'):
 
     if not known:
         print(
-            'Unable start conversion, list of known files is not found.' % filename)
+            'Unable start conversion, list of known files is not found.')
         return False
 
     # Files with [postfix] other than ours might have some additional data inside
@@ -154,28 +235,13 @@ def dat_to_bmp(filename, postfix='main'):
     height = current_file[3]
     postfix = current_file[4]
 
-    bmp_image = Image.new('RGB', (width, height), (0, 0, 0))
+    with profiling.timer('read'):
+        with open(filename, 'rb') as file:
+            raw_data = file.read()
+        profiling.count('files read')
+        profiling.count('bytes read', len(raw_data))
 
-    with open(filename, 'rb') as file:
-        raw_data = file.read()
-
-    data = []
-    i = 0
-    # skipping header of the file
-    for chunk in raw_data:
-        if i >= start:  # pixels start on this position
-            data.append(int(chunk))
-        else:
-            i += 1
-    i = 0
-    for img_y in range(0, height):
-        for img_x in range(0, width):
-            if i + 3 < len(data):
-                rgb_color = unpack_color(data[i], data[i + 1])
-                bmp_image.putpixel((img_x, img_y), rgb_color)
-                i += 2  # one bmp pixel is two bytes in game's pixels
-            else:
-                break
+    bmp_image = decode_image(raw_data, start, width, height)
 
     output_name = filename[0:-4] + '_' + str(postfix) + '.bmp'
 
@@ -187,7 +253,9 @@ def dat_to_bmp(filename, postfix='main'):
                 add).rjust(2, '0') + ').bmp'
             add += 1
 
-    bmp_image.save(output_name)
+    with profiling.timer('encode'):
+        bmp_image.save(output_name)
+    profiling.count('files written')
 
     print(
         'dat -> bmp conversion is successful. [%s] is converted and saved as [%s]' % (
@@ -200,18 +268,31 @@ def dat_to_bmp(filename, postfix='main'):
     return True
 
 
-def insert_bmp_into_dat(dat_name, postfix='main'):
+def insert_bmp_into_dat(dat_name, postfix='main', container=None):
     """
     Takes existing dat file and merge bmp image into it.
 
     :param dat_name: put our data into this file
     :param postfix: specified sub image (buttons, load bars, etc.)
+    :param container: zip file made by export_to_container func.
+                      If set, bmp image is taken from it instead of loose file
     :return: True if result saved, False if not
     """
+    from PIL import Image  # heavy, imported only when needed
+
     bmp_name = dat_name[0:-4] + '_' + postfix + '.bmp'
 
+    if container is not None and not is_container(container):
+        print('Unable to start conversion, [%s] is not found '
+              'or is not a zip file.' % container)
+        return False
+
     have_dat = os.path.isfile(dat_name)
-    have_bmp = os.path.isfile(bmp_name)
+
+    if container is None:
+        have_bmp = os.path.isfile(bmp_name)
+    else:
+        have_bmp = bmp_name in container_index(container)
 
     if not have_bmp and not have_dat:
         print(
@@ -231,7 +312,7 @@ def insert_bmp_into_dat(dat_name, postfix='main'):
 
     if not known:
         print(
-            'Unable to start conversion, list of known files is not found.' % dat_name)
+            'Unable to start conversion, list of known files is not found.')
         return False
 
     # Files with [postfix] other than ours might have some additional data inside
@@ -253,42 +334,37 @@ def insert_bmp_into_dat(dat_name, postfix='main'):
     start = current_file[1]
     postfix = current_file[4]
 
-    bmp_data = Image.open(bmp_name, 'r')
-    bmp_data = list(bmp_data.getdata())
-
-    with open(dat_name, 'rb') as dat_file:
-        raw_data = dat_file.read()
-
-    data = []
-
-    new_pixels = len(bmp_data)
-    pixel_space = 0
-
-    for i in range(0, len(raw_data), 2):
-        if start <= i < (
-                start + new_pixels * 2):  # one bmp pixel is two bytes in game's pixels
-            color = pack_color(bmp_data[pixel_space])
-            data.append(color[0])
-            data.append(color[1])
-            pixel_space += 1
+    with profiling.timer('read'):
+        if container is None:
+            bmp_data = Image.open(bmp_name, 'r')
+            profiling.count('bytes read', os.path.getsize(bmp_name))
         else:
-            data.append(raw_data[i])
-            data.append(raw_data[i + 1])
+            bmp_data = read_from_container(container, dat_name, postfix)
+        bmp_data = list(bmp_data.getdata())
+
+        with open(dat_name, 'rb') as dat_file:
+            raw_data = dat_file.read()
+        profiling.count('files read', 2)
+        profiling.count('bytes read', len(raw_data))
 
     # file wil be overwritten
     output_name = dat_name
 
-    binary_data = bytearray(data)
-    with open(output_name, 'wb') as result_file:
-        result_file.write(binary_data)
-        print(
-            'bmp -> dat conversion is successful. Data from [%s] is added to [%s]' % (
-                bmp_name, output_name))
+    binary_data = merge_image(raw_data, start, bmp_data)
+    with profiling.timer('write'):
+        with open(output_name, 'wb') as result_file:
+            result_file.write(binary_data)
+    profiling.count('files written')
+    profiling.count('bytes written', len(binary_data))
+    print(
+        'bmp -> dat conversion is successful. Data from [%s] is added to [%s]' % (
+            bmp_name, output_name))
 
     # recursive inserting
     if postfix == 'main' and len(sub_files) > 0:
         for file in sub_files:
-            insert_bmp_into_dat(file[0], file[4])  # filename.dat + postfix
+            insert_bmp_into_dat(file[0], file[4],
+                                container)  # filename.dat + postfix
     return True
 
 
@@ -319,6 +395,166 @@ def all_dat_to_bmp():
         print('Conversion complete. %d files converted.' % i)
 
 
+def container_entry(filename, postfix):
+    """Name of the image inside of container, same as name of loose bmp file."""
+    return filename[0:-4] + '_' + str(postfix) + '.bmp'
+
+
+def export_to_container(container=CONTAINER_FILE, files=None):
+    """
+    Extracts images from dat files into single uncompressed zip file
+    instead of many loose bmp files. Every image is stored under the same
+    name dat_to_bmp func would give it, zip index gives random access to them.
+
+    :param container: name of zip file, existing file is not overwritten
+    :param files: dat files to export, all known files in current directory if not set
+    :return: number of exported images. False if there are any errors.
+    """
+    known = get_known_files()
+
+    if not known:
+        print('Unable start conversion, list of known files is not found.')
+        return False
+
+    structure = {}
+    for line in known:
+        structure.setdefault(line[0], []).append(line)
+
+    if files is None:
+        files = sorted(file for file in structure if os.path.isfile(file))
+
+    base = container[0:-4]
+    add = 1
+    # do not overwrite!
+    while os.path.isfile(container):
+        container = base + '(' + str(add).rjust(2, '0') + ').zip'
+        add += 1
+
+    exported = 0
+    import zipfile
+
+    with zipfile.ZipFile(container, 'w', zipfile.ZIP_STORED) as archive:
+        for filename in files:
+            if filename not in structure or not os.path.isfile(filename):
+                print('Unable to export [%s], file is not found '
+                      'or has unknown structure.' % filename)
+                continue
+
+            with profiling.timer('read'):
+                with open(filename, 'rb') as file:
+                    raw_data = file.read()
+                profiling.count('files read')
+                profiling.count('bytes read', len(raw_data))
+
+            for _, start, width, height, postfix in structure[filename]:
+                bmp_image = decode_image(raw_data, start, width, height)
+                buffer = io.BytesIO()
+
+                with profiling.timer('encode'):
+                    bmp_image.save(buffer, 'BMP')
+
+                with profiling.timer('write'):
+                    archive.writestr(container_entry(filename, postfix),
+                                     buffer.getvalue())
+                profiling.count('bytes written', buffer.tell())
+                exported += 1
+
+            print('dat -> zip export is successful. [%s] is added to [%s]' %
+                  (filename, container))
+
+    profiling.count('files written')
+    print('Export complete. %d images saved into [%s].' %
+          (exported, container))
+    return exported
+
+
+def is_container(container):
+    """Check that container exists and can be read."""
+    import zipfile
+
+    return os.path.isfile(container) and zipfile.is_zipfile(container)
+
+
+def container_index(container):
+    """Names of all images in container."""
+    return set(archives.list_files(container))
+
+
+def read_from_container(container, filename, postfix='main'):
+    """
+    Reads single image from container without extracting anything else.
+
+    :param container: zip file made by export_to_container func
+    :param filename: dat file the image belongs to, like 'menus.dat'
+    :param postfix: specified sub image (buttons, load bars, etc.)
+    :return: RGB image
+    """
+    from PIL import Image  # heavy, imported only when needed
+
+    payload = archives.open_archive(container).read(
+        container_entry(filename, postfix))
+    profiling.count('bytes read', len(payload))
+
+    with Image.open(io.BytesIO(payload)) as bmp_image:
+        return bmp_image.convert('RGB')
+
+
+def import_from_container(container=CONTAINER_FILE):
+    """
+    Puts all images from container back into their dat files.
+    Each dat file is read and written only once.
+
+    :param container: zip file made by export_to_container func
+    :return: number of updated dat files. False if there are any errors.
+    """
+    if not is_container(container):
+        print('Unable to start conversion, [%s] is not found '
+              'or is not a zip file.' % container)
+        return False
+
+    known = get_known_files()
+
+    if not known:
+        print('Unable to start conversion, list of known files is not found.')
+        return False
+
+    index = container_index(container)
+    structure = {}
+    for line in known:
+        if container_entry(line[0], line[4]) in index:
+            structure.setdefault(line[0], []).append(line)
+
+    updated = 0
+    for filename, lines in structure.items():
+        if not os.path.isfile(filename):
+            print('Unable to import into [%s], file is not found.' % filename)
+            continue
+
+        with profiling.timer('read'):
+            with open(filename, 'rb') as file:
+                raw_data = file.read()
+            profiling.count('files read')
+            profiling.count('bytes read', len(raw_data))
+
+        for _, start, _, _, postfix in lines:
+            with profiling.timer('read'):
+                bmp_data = list(read_from_container(container, filename,
+                                                    postfix).getdata())
+            raw_data = merge_image(raw_data, start, bmp_data)
+
+        with profiling.timer('write'):
+            with open(filename, 'wb') as file:
+                file.write(raw_data)
+        profiling.count('files written')
+        profiling.count('bytes written', len(raw_data))
+        updated += 1
+
+        print('zip -> dat import is successful. %d images from [%s] '
+              'are added to [%s]' % (len(lines), container, filename))
+
+    return updated
+
+
 def extract_piece_of_dat(filename, position):
     """
     Extracts section of dat file located after [position].
@@ -364,26 +600,45 @@ def extract_piece_of_dat(filename, position):
     return True
 
 
-if __name__ == '__main__':
-    args = sys.argv[1:]
-
-    if len(args) != 2:
+def main(args):
+    """Command line interface, see README.md for examples."""
+    if len(args) not in (2, 3):
         print('You need to specify mode and target to run this script')
         print()
         print('Possible examples:')
         print('python images.py extract *')
         print('python images.py extract somefile.dat')
         print('python images.py insert somefile.dat')
+        print('python images.py export * [container.zip]')
+        print('python images.py export somefile.dat [container.zip]')
+        print('python images.py import container.zip')
+        print('python images.py insert somefile.dat container.zip')
+        print()
+        print('Add --profile to see time spent on each stage, '
+              '--profile-dump file.prof to save cProfile dump, '
+              '--report file.json to save json report')
         sys.exit()
 
-    mode, target, *_ = args
+    mode, target, *rest = args
     mode = mode.lower()
 
     if mode == 'extract':
         dat_to_bmp(target)
 
     elif mode == 'insert':
-        insert_bmp_into_dat(target)
+        insert_bmp_into_dat(target, container=rest[0] if rest else None)
+
+    elif mode == 'export':
+        export_to_container(rest[0] if rest else CONTAINER_FILE,
+                            None if target == '*' else [target])
+
+    elif mode == 'import':
+        import_from_container(target)
 
     else:
         print(f'Arguments are not recognised: {args}')
+
+
+if __name__ == '__main__':
+    arguments, profile_options = profiling.parse_args(sys.argv[1:])
+    profiling.run(main, profile_options, arguments)
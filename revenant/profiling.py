@@ -0,0 +1,227 @@
+"""Instrumentation shared by command line tools.
+
+Collects time spent on every stage of processing and counters
+(files read, bytes read, stat calls, tiles pasted, etc.).
+Collected data is printed as a summary or saved as json report,
+whole run can also be profiled with cProfile.
+
+Example:
+
+    with profiling.timer('scan'):
+        ...
+        profiling.count('stat calls')
+
+Command line options (understood by automaps.py and images.py):
+
+    --profile               print summary after the run
+    --profile-dump FILE     also save cProfile dump into FILE,
+                            worker threads (scanning, encoding) included
+    --report FILE           save json report into FILE
+"""
+import json
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+_lock = threading.Lock()
+_counters = {}
+_timings = {}
+_profilers = []
+
+
+def count(name, value=1):
+    """Increase counter [name] by [value]."""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+@contextmanager
+def timer(name):
+    """Measure time spent inside of the block as stage [name]."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        with _lock:
+            calls, total = _timings.get(name, (0, 0.0))
+            _timings[name] = (calls + 1, total + elapsed)
+
+
+def timed(name):
+    """Decorator, measures every call of the function as stage [name]."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with timer(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def reset():
+    """Forget everything collected so far."""
+    with _lock:
+        _counters.clear()
+        _timings.clear()
+
+
+def report():
+    """
+    Collected data in json-friendly form.
+
+    :return: dictionary with counters and stages
+    """
+    with _lock:
+        return {
+            'counters': dict(sorted(_counters.items())),
+            'stages': {
+                name: {'calls': calls, 'seconds': round(total, 6)}
+                for name, (calls, total) in sorted(_timings.items())
+            },
+        }
+
+
+def print_summary(data=None):
+    """Print collected data as a table."""
+    data = data or report()
+
+    print()
+    print('Stage                     calls     seconds')
+    for name, stage in data['stages'].items():
+        print('%-24s %6d %11.3f' % (name, stage['calls'], stage['seconds']))
+
+    print()
+    print('Counter                           value')
+    for name, value in data['counters'].items():
+        print('%-24s %14d' % (name, value))
+
+
+def save_report(filename, data=None, extra=None):
+    """
+    Save collected data as json file.
+
+    :param filename: where to save report
+    :param data: report to save, current one is used if not given
+    :param extra: additional fields (command line, date, etc.)
+    """
+    data = dict(data or report())
+    data.update(extra or {})
+
+    with open(filename, 'w') as file:
+        json.dump(data, file, indent=2)
+
+    print('Report saved as [%s]' % filename)
+
+
+def _profile_thread(*_):
+    """Start own profiler in every new thread, cProfile sees only one thread."""
+    import cProfile
+
+    sys.setprofile(None)
+    profiler = cProfile.Profile()
+    with _lock:
+        _profilers.append(profiler)
+    profiler.enable()
+
+
+def save_profile(filename, profiler):
+    """
+    Save cProfile dump of the main thread merged with all worker threads.
+
+    :param filename: where to save dump
+    :param profiler: profiler of the main thread
+    """
+    import pstats
+
+    stats = pstats.Stats(profiler)
+
+    with _lock:
+        workers = list(_profilers)
+        _profilers.clear()
+
+    for worker in workers:
+        worker.create_stats()
+        if worker.stats:
+            stats.add(worker)
+
+    stats.dump_stats(filename)
+    print('cProfile dump saved as [%s]' % filename)
+
+
+def parse_args(args):
+    """
+    Remove profiling options from command line arguments.
+
+    :param args: arguments like sys.argv[1:]
+    :return: tuple (remaining arguments, options dictionary)
+    """
+    options = {'profile': False, 'dump': None, 'report': None}
+    remaining = []
+
+    args = iter(args)
+    for arg in args:
+        if arg == '--profile':
+            options['profile'] = True
+        elif arg == '--profile-dump':
+            options['profile'] = True
+            options['dump'] = next(args, None)
+        elif arg == '--report':
+            options['report'] = next(args, None)
+        else:
+            remaining.append(arg)
+
+    return remaining, options
+
+
+def run(func, options, *args, **kwargs):
+    """
+    Run [func] collecting data requested by command line options.
+
+    :param func: what to run
+    :param options: options dictionary from parse_args func
+    :return: result of the function
+    """
+    reset()
+    profiler = None
+
+    if options['dump']:
+        import cProfile  # not needed for light commands
+        profiler = cProfile.Profile()
+
+    started = time.time()
+
+    # since 3.12 cProfile is not limited to the thread that enabled it
+    per_thread = profiler is not None and sys.version_info < (3, 12)
+
+    if per_thread:
+        threading.setprofile(_profile_thread)
+
+    try:
+        with timer('total'):
+            if profiler is not None:
+                result = profiler.runcall(func, *args, **kwargs)
+            else:
+                result = func(*args, **kwargs)
+    finally:
+        if per_thread:
+            threading.setprofile(None)
+
+    if profiler is not None:
+        save_profile(options['dump'], profiler)
+
+    data = report()
+
+    if options['profile']:
+        print_summary(data)
+
+    if options['report']:
+        save_report(options['report'], data, {
+            'argv': sys.argv,
+            'started': started,
+            'result': result if isinstance(result, (bool, int)) else None,
+        })
+
+    return result
@@ -0,0 +1,431 @@
+"""Local tile server.
+
+This module serves automap, heatmap and progress images of the game
+install over HTTP. Nothing is stitched in advance: every requested block
+of tiles is rendered on demand from name_x_y files, using the same
+rendering functions as automaps.py. Rendered blocks are cached in memory
+and on disk, cache entries are validated by mtime and size of source files.
+
+Start server for automaps, map files and a savegame:
+
+    python server.py --automaps automaps --maps map --savegame savegame
+
+Available addresses:
+
+    /                                   json with known maps and their bounds
+    /automaps/[map].png                 whole automap
+    /automaps/[map]/[bx]_[by].png       block of tiles
+    /heatmaps/[map]/[bx]_[by].png       same for heatmaps
+    /progress/[map]/[bx]_[by].png       same for player's progress
+
+Block [bx]_[by] covers game tiles from bx * BLOCK_SIZE to
+bx * BLOCK_SIZE + BLOCK_SIZE - 1 (same for y).
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from email.utils import formatdate, parsedate_to_datetime
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    from revenant import archives, automaps
+except ImportError:  # launched as a script from revenant directory
+    import archives
+    import automaps
+
+BLOCK_SIZE = 8  # in game tiles
+MEMORY_CACHE_SIZE = 256  # in rendered blocks
+CACHE_DIR = 'RevAPI_cache'
+
+BLOCK_PATTERN = re.compile(r'^/(automaps|heatmaps|progress)/(\d+)'
+                           r'(?:/(-?\d+)_(-?\d+))?\.png$')
+
+
+class TileSource:
+    """Directory with name_x_y files, rescanned when directory changes."""
+
+    def __init__(self, directory, extension):
+        self.directory = directory
+        self.extension = extension
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._data = {}
+
+    @property
+    def data(self):
+        """Actual result of scan_for_files for this directory."""
+        # folder inside of the archive changes only with the archive itself
+        try:
+            mtime = os.stat(archives.archive_path(self.directory)
+                            or self.directory).st_mtime_ns
+        except OSError:
+            return {}
+
+        with self._lock:
+            # adding or removing files changes mtime of the directory
+            if mtime != self._mtime:
+                self._data = automaps.scan_for_files(self.directory,
+                                                     self.extension) or {}
+                self._mtime = mtime
+            return self._data
+
+    def fingerprint(self, key, x0, y0, x1, y1):
+        """Collect (name, mtime, size) for every tile in given region.
+        Rescans directory if size of any tile differs from the index.
+
+        :return: tuple (list of fingerprints, latest mtime in seconds)
+        """
+        result, latest, outdated = self._fingerprint(key, x0, y0, x1, y1)
+
+        # files rewritten in place do not change mtime of the directory
+        if outdated:
+            with self._lock:
+                self._mtime = None
+            result, latest, _ = self._fingerprint(key, x0, y0, x1, y1)
+
+        return result, latest
+
+    def _fingerprint(self, key, x0, y0, x1, y1):
+        data = self.data
+        if key not in data:
+            return [], 0, False
+
+        directory = data[key][5]
+        result = []
+        latest = 0
+        outdated = False
+
+        # tiles inside of the archive change only with the archive itself
+        archive = archives.archive_path(self.directory)
+        if archive is not None:
+            stat = os.stat(archive)
+            result.append((self.directory, stat.st_mtime_ns, stat.st_size))
+            latest = stat.st_mtime
+            directory = None
+
+        for x, y, size in automaps.tiles_in_region(data, key,
+                                                   x0, y0, x1, y1):
+            name = '%d_%d_%d.%s' % (key, x, y, self.extension)
+            if directory is None:
+                result.append(name)
+                continue
+            try:
+                stat = os.stat(directory + name)
+            except OSError:
+                outdated = True
+                continue
+            outdated = outdated or stat.st_size != size
+            result.append((name, stat.st_mtime_ns, stat.st_size))
+            latest = max(latest, stat.st_mtime)
+
+        # colors of heatmap tiles depend on the biggest file of the map
+        result.append(('max_size', data[key][7]))
+        return result, latest, outdated
+
+
+class TileCache:
+    """Two level cache for rendered blocks: memory (LRU) and disk."""
+
+    def __init__(self, directory=CACHE_DIR, capacity=MEMORY_CACHE_SIZE):
+        self.directory = directory
+        self.capacity = capacity
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._render_locks = {}  # name -> [lock, number of users]
+        self._files = {}  # name -> etags of files on disk
+
+        # files left by previous runs, listed only once
+        if os.path.isdir(directory):
+            for file in os.listdir(directory):
+                name, _, etag = file[:-4].rpartition('_')
+                if file.endswith('.png') and name and etag.isalnum():
+                    self._files.setdefault(name, set()).add(etag)
+
+    def _path(self, name, etag):
+        return os.path.join(self.directory, '%s_%s.png' % (name, etag))
+
+    @contextmanager
+    def render_lock(self, name):
+        """Lock that prevents concurrent rendering of the same block."""
+        with self._lock:
+            entry = self._render_locks.setdefault(name, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            # drop lock of the block nobody waits for
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._render_locks[name]
+
+    def get(self, name, etag):
+        """Return cached payload for the block or None."""
+        with self._lock:
+            cached = self._memory.get(name)
+            if cached is not None and cached[0] == etag:
+                self._memory.move_to_end(name)
+                return cached[1]
+
+        # file can be replaced by concurrent put at any moment
+        try:
+            with open(self._path(name, etag), 'rb') as file:
+                payload = file.read()
+        except FileNotFoundError:
+            return None
+
+        self._remember(name, etag, payload)
+        return payload
+
+    def put(self, name, etag, payload):
+        """Save payload in memory and on disk, drop outdated versions."""
+        self._remember(name, etag, payload)
+
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory, exist_ok=True)
+
+        # write under temporary name so readers never see partial files
+        path = self._path(name, etag)
+        temp = '%s.%d.tmp' % (path, threading.get_ident())
+        with open(temp, 'wb') as file:
+            file.write(payload)
+        os.replace(temp, path)
+
+        with self._lock:
+            outdated = self._files.get(name, set()) - {etag}
+            self._files[name] = {etag}
+
+        for old_etag in outdated:
+            try:
+                os.remove(self._path(name, old_etag))
+            except OSError:
+                pass
+
+    def _remember(self, name, etag, payload):
+        with self._lock:
+            self._memory[name] = (etag, payload)
+            self._memory.move_to_end(name)
+            while len(self._memory) > self.capacity:
+                self._memory.popitem(last=False)
+
+
+class TileServer(ThreadingHTTPServer):
+    """HTTP server that knows where to take tiles from."""
+    daemon_threads = True
+
+    def __init__(self, address, automaps_dir=None, maps_dir=None,
+                 savegame_dir=None, cache_dir=CACHE_DIR):
+        super().__init__(address, TileRequestHandler)
+        self.sources = {
+            'automaps': TileSource(automaps_dir, 'bmp') if automaps_dir else None,
+            'heatmaps': TileSource(maps_dir, 'dat') if maps_dir else None,
+            'progress': TileSource(savegame_dir, 'dat') if savegame_dir else None,
+        }
+        self.cache = TileCache(cache_dir)
+
+    def index(self):
+        """Describe known maps and their bounds."""
+        result = {'block_size': BLOCK_SIZE}
+        for kind, source in self.sources.items():
+            if source is None:
+                continue
+            result[kind] = {
+                str(key): {
+                    'tiles': value[0],
+                    'min_x': value[1],
+                    'max_x': value[2],
+                    'min_y': value[3],
+                    'max_y': value[4],
+                }
+                for key, value in source.data.items()
+            }
+        return result
+
+    def region_sources(self, kind):
+        """Sources required to render given kind of images."""
+        if kind == 'automaps':
+            return [self.sources['automaps']]
+        # progress is painted over original heatmap
+        if kind == 'progress':
+            return [self.sources['heatmaps'], self.sources['progress']]
+        return [self.sources['heatmaps']]
+
+    def render(self, kind, key, x0, y0, x1, y1):
+        """Render region and encode it as png.
+
+        :return: png bytes or None if there's nothing to draw
+        """
+        sources = self.region_sources(kind)
+
+        if kind == 'automaps':
+            image, count = automaps.render_automap(sources[0].data, key,
+                                                   x0, y0, x1, y1)
+        elif kind == 'heatmaps':
+            image, count = automaps.render_heatmap(sources[0].data, key,
+                                                   x0, y0, x1, y1)
+        else:
+            image, count = automaps.render_progress(sources[0].data,
+                                                    sources[1].data, key,
+                                                    x0, y0, x1, y1)
+
+        if not count:
+            return None
+
+        buffer = io.BytesIO()
+        image.save(buffer, 'PNG')
+        return buffer.getvalue()
+
+
+class TileRequestHandler(BaseHTTPRequestHandler):
+    """Answers requests for rendered blocks."""
+    server: TileServer
+
+    def do_GET(self):
+        path = self.path.split('?', 1)[0]
+
+        if path in ('/', '/index.json'):
+            payload = json.dumps(self.server.index(), indent=2).encode()
+            return self._send(HTTPStatus.OK, payload, 'application/json')
+
+        match = BLOCK_PATTERN.match(path)
+        if match is None:
+            return self._send(HTTPStatus.NOT_FOUND, b'Unknown address',
+                              'text/plain')
+
+        kind, key, block_x, block_y = match.groups()
+        key = int(key)
+        sources = self.server.region_sources(kind)
+
+        if any(source is None for source in sources):
+            return self._send(HTTPStatus.NOT_FOUND,
+                              b'Server was started without this source',
+                              'text/plain')
+
+        bounds = sources[0].data.get(key)
+        if bounds is None:
+            return self._send(HTTPStatus.NOT_FOUND, b'Unknown map',
+                              'text/plain')
+
+        if block_x is None:
+            name = '%s_%d' % (kind, key)
+            x0, x1, y0, y1 = bounds[1:5]
+        else:
+            block_x = int(block_x)
+            block_y = int(block_y)
+            name = '%s_%d_%d_%d' % (kind, key, block_x, block_y)
+            x0 = block_x * BLOCK_SIZE
+            y0 = block_y * BLOCK_SIZE
+            x1 = x0 + BLOCK_SIZE - 1
+            y1 = y0 + BLOCK_SIZE - 1
+
+        fingerprints = []
+        latest = 0
+        for source in sources:
+            fingerprint, mtime = source.fingerprint(key, x0, y0, x1, y1)
+            fingerprints.append(fingerprint)
+            latest = max(latest, mtime)
+
+        etag = hashlib.md5(repr((name, x0, y0, x1, y1,
+                                 fingerprints)).encode()).hexdigest()[:16]
+        headers = {
+            'ETag': '"%s"' % etag,
+            'Last-Modified': formatdate(latest, usegmt=True),
+            'Cache-Control': 'no-cache',
+        }
+
+        if self._not_modified(etag, latest):
+            return self._send(HTTPStatus.NOT_MODIFIED, None, None, headers)
+
+        cache = self.server.cache
+        payload = cache.get(name, etag)
+
+        if payload is None:
+            with cache.render_lock(name):
+                # someone else could render it while we were waiting
+                payload = cache.get(name, etag)
+                if payload is None:
+                    payload = self.server.render(kind, key, x0, y0, x1, y1)
+                    if payload is None:
+                        return self._send(HTTPStatus.NOT_FOUND,
+                                          b'Nothing to draw here',
+                                          'text/plain')
+                    cache.put(name, etag, payload)
+
+        return self._send(HTTPStatus.OK, payload, 'image/png', headers)
+
+    def _not_modified(self, etag, latest):
+        """Check conditional headers of the request."""
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match is not None:
+            tags = [tag.strip().strip('"') for tag in if_none_match.split(',')]
+            return etag in tags or '*' in tags
+
+        if_modified_since = self.headers.get('If-Modified-Since')
+        if if_modified_since is not None:
+            try:
+                since = parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+            return int(latest) <= since
+
+        return False
+
+    def _send(self, status, payload, content_type, headers=None):
+        self.send_response(status)
+        for header, value in (headers or {}).items():
+            self.send_header(header, value)
+        if payload is not None:
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        if payload is not None:
+            self.wfile.write(payload)
+
+
+def serve(automaps_dir=None, maps_dir=None, savegame_dir=None,
+          host='127.0.0.1', port=8000, cache_dir=CACHE_DIR):
+    """
+    Starts tile server and blocks until interrupted.
+
+    :param automaps_dir: directory (or zip/tar archive) with name_x_y.bmp automap tiles
+    :param maps_dir: directory with original name_x_y.dat map files
+    :param savegame_dir: directory with name_x_y.dat files from savegame
+    :param host: address to listen on
+    :param port: port to listen on
+    :param cache_dir: where to store rendered blocks
+    """
+    server = TileServer((host, port), automaps_dir, maps_dir,
+                        savegame_dir, cache_dir)
+    print(f'Serving tiles on http://{host}:{port}/ (Ctrl+C to stop)')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print('Server stopped')
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local Revenant tile server')
+    parser.add_argument('--automaps', help='directory with automap tiles')
+    parser.add_argument('--maps', help='directory with original map files')
+    parser.add_argument('--savegame', help='directory with savegame files')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--cache', default=CACHE_DIR,
+                        help='where to store rendered blocks')
+    args = parser.parse_args()
+
+    if not (args.automaps or args.maps):
+        parser.error('You need to specify --automaps or --maps directory')
+
+    serve(args.automaps, args.maps, args.savegame,
+          args.host, args.port, args.cache)
@@ -0,0 +1,322 @@
+"""Tiles scanning.
+
+This module finds files named by pattern [name]_[x]_[y].[extension]
+(automap tiles and map dat files) and builds index of them.
+It does not depend on PIL, so scanning is cheap to start.
+"""
+import os.path
+from typing import List, Optional, Tuple
+
+try:
+    from revenant import archives, profiling
+except ImportError:  # launched as a script from revenant directory
+    import archives
+    import profiling
+
+
+@profiling.timed('scan')
+def scan_for_files(directory, extension, verbose=True, key=None, box=None):
+    """
+    Scans directory for sequence of files.
+    Considered pattern is [name]_[x]_[y].
+    Both maps ('dat' files) and automaps ('bmp' files) are supported,
+    but you need to mention file extension.
+
+    Each parameter in filename must be a number (including negative),
+    Length of the parameter must be less than 4 letters.
+
+    :param directory: where to search files, for example 'automaps/",
+                      zip or tar archive with files is also supported
+    :param extension: specific type of file, only 'bmp' or 'dat' are supported
+    :param verbose: print progress messages
+    :param key: only files of this map are collected, all maps if not set
+    :param box: (x0, y0, x1, y1), only files inside of it are collected
+                (inclusive). Other files are skipped before stat call
+    :return: dictionary with found sequences and their parameters. False if nothing found
+    """
+    if directory[-1] != '/' and directory[-1] != '\\':
+        directory = directory + '/'
+
+    archive = archives.archive_path(directory)
+
+    try:
+        if archive is not None:
+            # names and sizes are taken from the index of the archive
+            entries = list(archives.list_files(directory).items())
+        else:
+            # scandir gives file type without additional stat calls
+            with os.scandir(directory) as iterator:
+                entries = [(entry.name, entry) for entry in iterator]
+        profiling.count('directories scanned')
+        profiling.count('files scanned', len(entries))
+    except archives.DuplicateNamesError as error:
+        if verbose:
+            print(error)
+        return False
+    except OSError:
+        if verbose:
+            print(f'No directory named "{directory}" has been found!')
+        return False
+
+    if verbose:
+        print(f'Scanning "{directory}" for files like "name_x_y.{extension}"')
+
+    raw_data = []
+    ignored = 0
+
+    for file, entry in entries:
+        if file[-3:].lower() != extension.lower():
+            # wrong extension
+            ignored += 1
+            continue
+
+        if archive is not None or entry.is_file():
+            name_x_y = parse_tile_name(file)
+
+            if name_x_y and not in_region(name_x_y, key, box):
+                continue
+
+            if name_x_y:
+                # Files are named by pattern name_x_y.type
+                if archive is not None:
+                    file_size = entry
+                else:
+                    file_size = entry.stat().st_size
+                    profiling.count('stat calls')
+                raw_data.append([*name_x_y, file_size])
+            else:
+                ignored += 1
+                continue
+
+    data = group_tiles(raw_data, directory)
+
+    if not data:
+        if verbose:
+            print('...nothing found')
+        return False
+
+    if verbose:
+        print()
+        print('\t Found %d tiles for %d maps in "%s" (%d files ignored)' %
+              (len(raw_data), len(data.keys()), directory[:-1], ignored))
+    return data
+
+
+def output_name(directory):
+    """
+    Makes flat name for result files out of source directory.
+    For example 'maps/world/' becomes 'maps_world'.
+
+    :param directory: where tiles were found
+    :return: name without path separators
+    """
+    parts = os.path.normpath(directory).replace('\\', '/').split('/')
+    parts = [part.replace(':', '') for part in parts
+             if part not in ('', os.curdir, os.pardir)]
+    return '_'.join(parts) or 'root'
+
+
+def in_region(name_x_y, key=None, box=None):
+    """
+    Checks that tile belongs to the map and lies inside of the box.
+
+    :param name_x_y: tuple (name, x, y) from parse_tile_name func
+    :param key: map name, any map if not set
+    :param box: (x0, y0, x1, y1) inclusive, anywhere if not set
+    :return: True if tile is inside
+    """
+    name, x, y = name_x_y
+
+    if key is not None and name != key:
+        return False
+
+    if box is not None:
+        x0, y0, x1, y1 = box
+        return (min(x0, x1) <= x <= max(x0, x1)
+                and min(y0, y1) <= y <= max(y0, y1))
+
+    return True
+
+
+def parse_tile_name(file):
+    """
+    Parses file name made by pattern [name]_[x]_[y].[extension].
+
+    Each parameter in filename must be a number (including negative),
+    Length of the parameter must be less than 4 letters.
+
+    :param file: file name with extension, like '1_-3_12.bmp'
+    :return: tuple (name, x, y) or None if file name does not fit the pattern
+    """
+    name_x_y = file.split('_')
+
+    if len(name_x_y) != 3:
+        return None
+
+    # removing extension
+    name_x_y[2] = name_x_y[2][0:-4]
+
+    for param in name_x_y:
+        if len(param) > 3 or not param:
+            return None
+
+    if not str(name_x_y[0]).isdigit():
+        return None
+
+    for param in name_x_y[1:]:
+        # checking for negative numbers
+        if param[0] == '-':
+            param = param[1:]
+
+        if not str(param).isdigit():
+            return None
+
+    return int(name_x_y[0]), int(name_x_y[1]), int(name_x_y[2])
+
+
+def group_tiles(raw_data, directory):
+    """
+    Groups found tiles by map name.
+
+    :param raw_data: list of [name, x, y, file_size] lists
+    :param directory: where tiles were found, ends with slash
+    :return: dictionary in format of scan_for_files func (empty if no tiles)
+    """
+    tiles_by_name = {}
+    source = None
+
+    for name, x, y, file_size in raw_data:
+        tiles_by_name.setdefault(name, {})[(x, y)] = file_size
+
+    data = {}
+
+    # directory (or archive) is resolved once for all tiles
+    if tiles_by_name:
+        try:
+            source = archives.resolve(directory)
+        except (OSError, ValueError):
+            source = None
+
+    for name in sorted(tiles_by_name):
+        tiles = tiles_by_name[name]
+        list_of_x = [x for x, _ in tiles]
+        list_of_y = [y for _, y in tiles]
+        list_of_sizes = list(tiles.values())
+
+        # Data is formed using template
+        # [name]:[counts][minX][maxX][minY][maxY][directory][min_size][max_size][tiles][source]
+        # where [tiles] is an index {(x, y): file_size} of existing files
+        # and [source] opens them (see archives.resolve func)
+        data[name] = [
+            len(tiles),
+            min(list_of_x),
+            max(list_of_x),
+            min(list_of_y),
+            max(list_of_y),
+            directory,
+            min(list_of_sizes),
+            max(list_of_sizes),
+            tiles,
+            source,
+        ]
+
+    return data
+
+
+def open_tile(data, key, name):
+    """
+    Opens file of the map found by scan_for_files func.
+
+    :param data: prepared dictionary from scan_for_files func
+    :param key: map name
+    :param name: base name of the file, like '1_2_3.bmp'
+    :return: path for regular files, file-like object for archives
+    """
+    source = data[key][9]
+    if source is None:
+        return archives.open_file(data[key][5], name)
+    return source.open(name)
+
+
+def tiles_in_region(data, key, x0, y0, x1, y1):
+    """
+    Iterates over existing tiles of the map inside of given region.
+
+    Not all files in allowed range actually exist, so only indexed
+    tiles are returned. Cost depends on the smaller of region area
+    and number of tiles in the map.
+
+    :param data: prepared dictionary from scan_for_files func
+    :param key: map name
+    :param x0: left border of the region (inclusive)
+    :param y0: top border of the region (inclusive)
+    :param x1: right border of the region (inclusive)
+    :param y1: bottom border of the region (inclusive)
+    :return: generator of (x, y, file_size) tuples
+    """
+    tiles = data[key][8]
+
+    if (x1 - x0 + 1) * (y1 - y0 + 1) <= len(tiles):
+        for curr_y in range(y0, y1 + 1):
+            for curr_x in range(x0, x1 + 1):
+                file_size = tiles.get((curr_x, curr_y))
+                if file_size is not None:
+                    yield curr_x, curr_y, file_size
+    else:
+        for (curr_x, curr_y), file_size in sorted(tiles.items(),
+                                                  key=lambda t: t[0][::-1]):
+            if x0 <= curr_x <= x1 and y0 <= curr_y <= y1:
+                yield curr_x, curr_y, file_size
+
+
+def discover_folders(path: str) -> List[str]:
+    """Find given directory and all nested directories.
+
+    Symbolic links and hidden directories are not followed.
+    Directories are returned in sorted order, parents first.
+    For archives, folders inside of them that contain files are returned.
+    """
+    if archives.archive_path(path) is not None:
+        try:
+            return archives.list_folders(path)
+        except OSError:
+            return [path]
+
+    folders = []
+    pending = [path]
+
+    while pending:
+        current = pending.pop()
+        folders.append(current)
+        try:
+            with os.scandir(current) as iterator:
+                pending.extend(
+                    entry.path for entry in iterator
+                    if entry.is_dir(follow_symlinks=False)
+                    and not entry.name.startswith('.')
+                )
+        except OSError:
+            continue
+
+    return sorted(folders, key=lambda folder: folder.split(os.sep))
+
+
+def scan_folders(folders: List[str], extension: str,
+                 workers: Optional[int] = None,
+                 verbose: bool = True) -> List[Tuple[str, dict]]:
+    """Scan many directories at once.
+
+    Scanning is mostly waiting for the disk, so directories are processed
+    on a thread pool and their stat calls overlap.
+
+    :return: list of (folder, tile index) for folders with suitable files
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(lambda folder: scan_for_files(folder,
+                                                             extension,
+                                                             verbose),
+                               folders)
+        return [(folder, data) for folder, data in zip(folders, results)
+                if data]